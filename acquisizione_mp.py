@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Acquisizione multi-processo: ingestione BLE/seriale snella + worker collegati da un anello in memoria condivisa.
+
+Il processo principale esegue solo completo.main() con handler che trasformano
+ogni lettura in un campione a layout fisso e lo copiano (senza pickle) in un
+anello circolare in multiprocessing.shared_memory per ogni worker. I worker
+(per ora il solo ruolo "fusione": fusione, log CSV, aggregazione e console) leggono
+i campioni e chiamano le stesse funzioni apply_* / process_reading di completo.py.
+Un ruolo di serving (dati in tempo reale verso client esterni) non e' ancora
+implementato: completo.py non ha un server da spostare in un worker.
+
+Con --bench N confronta il throughput con la modalita' a processo singolo.
+"""
+import argparse
+import asyncio
+import contextlib
+import multiprocessing as mp
+import os
+import random
+import signal
+import struct
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import completo
+from aggregatore import AggregatoreVento
+
+# ----------------- CONFIG -----------------
+SLOT_ANELLO = 4096          # campioni per anello (~40 s di WT901 a 100 Hz)
+POLL_S = 0.001              # attesa del worker con anello vuoto
+
+# tipi di campione
+GPS, ACC, MAG, VENTO = 1, 2, 3, 4
+
+# header: write_seq e read_seq su linee di cache separate
+_SEQ = struct.Struct("<Q")
+_OFF_WRITE = 0
+_OFF_READ = 64
+_HEADER = 128
+# slot: tipo, t (unix), 6 valori, poi il numero di sequenza dello slot in coda
+_DATI = struct.Struct("<Qd6d")
+_SLOT_SIZE = _DATI.size + _SEQ.size
+
+
+class AnelloCampioni:
+    """Anello SPSC (un produttore, un consumatore) di campioni a layout fisso in memoria condivisa.
+
+    Il produttore scrive i dati dello slot e il numero di sequenza in fondo
+    allo slot, poi pubblica write_seq; il consumatore legge write_seq, gli slot
+    fino a li' e poi pubblica read_seq. Python non emette barriere di memoria e
+    il Raspberry Pi (ARM) puo' riordinare le scritture, quindi gli indici si
+    leggono e scrivono sotto un multiprocessing.Lock: acquire/release fanno da
+    barriera, e' un'operazione per push o per lotto letto e i dati restano
+    senza pickle. Ad anello pieno il campione viene scartato e contato in
+    persi (l'ingestione non deve mai bloccarsi).
+    """
+
+    def __init__(self, nome=None, slot=SLOT_ANELLO, lock=None):
+        if nome is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=_HEADER + slot * _SLOT_SIZE)
+            self.shm.buf[:_HEADER] = bytes(_HEADER)
+            self.lock = mp.Lock()
+            self.proprietario = True
+        else:
+            if lock is None:
+                raise ValueError("Per aprire un anello esistente serve anche il suo lock")
+            self.shm = shared_memory.SharedMemory(name=nome)
+            self.lock = lock
+            self.proprietario = False
+        self.nome = self.shm.name
+        self.slot = (self.shm.size - _HEADER) // _SLOT_SIZE
+        self.buf = self.shm.buf
+        self.persi = 0
+        # copie locali degli indici: ognuno legge dalla memoria condivisa solo quello dell'altro lato
+        self._w = self._leggi(_OFF_WRITE)
+        self._r = self._leggi(_OFF_READ)
+
+    def _leggi(self, off):
+        return _SEQ.unpack_from(self.buf, off)[0]
+
+    def _scrivi(self, off, v):
+        _SEQ.pack_into(self.buf, off, v)
+
+    def _leggi_indice(self, off):
+        with self.lock:
+            return self._leggi(off)
+
+    def _pubblica(self, off, v):
+        with self.lock:
+            self._scrivi(off, v)
+
+    def push(self, tipo, t, a=0.0, b=0.0, c=0.0, d=0.0, e=0.0, f=0.0):
+        w = self._w
+        if w - self._r >= self.slot:
+            # sembra pieno: rilegge read_seq solo in questo caso
+            self._r = self._leggi_indice(_OFF_READ)
+            if w - self._r >= self.slot:
+                self.persi += 1
+                return False
+        off = _HEADER + (w % self.slot) * _SLOT_SIZE
+        _DATI.pack_into(self.buf, off, tipo, t, a, b, c, d, e, f)
+        _SEQ.pack_into(self.buf, off + _DATI.size, w + 1)
+        self._w = w + 1
+        self._pubblica(_OFF_WRITE, w + 1)
+        return True
+
+    def pop_tutti(self):
+        """Restituisce i campioni disponibili come tuple (tipo, t, v0..v5)."""
+        r = self._r
+        w = self._leggi_indice(_OFF_WRITE)
+        if r == w:
+            return []
+        out = []
+        while r < w:
+            off = _HEADER + (r % self.slot) * _SLOT_SIZE
+            if self._leggi(off + _DATI.size) != r + 1:
+                break       # controllo di coerenza: non dovrebbe succedere dopo il lock
+            out.append(_DATI.unpack_from(self.buf, off))
+            r += 1
+        self._r = r
+        self._pubblica(_OFF_READ, r)
+        return out
+
+    def in_coda(self):
+        with self.lock:
+            return self._leggi(_OFF_WRITE) - self._leggi(_OFF_READ)
+
+    def letti(self):
+        return self._leggi_indice(_OFF_READ)
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.proprietario:
+            self.shm.unlink()
+
+
+# ----------------- WORKER -----------------
+def applica_campione(campione):
+    """Applica un campione allo stato di completo.py come farebbe il processo singolo."""
+    tipo, t, a, b, c, _, _, _ = campione
+    if tipo == GPS:
+        completo.apply_gps_fix(a, b, c)
+    elif tipo == ACC:
+        completo.apply_acc(a, b, c)
+    elif tipo == MAG:
+        completo.apply_mag(a, b, c)
+    elif tipo == VENTO:
+        awa = int(b) if b.is_integer() else b
+        completo.process_reading(SimpleNamespace(wind_speed=a, wind_direction=awa),
+                                 now=datetime.utcfromtimestamp(t))
+
+
+def worker_fusione(nome_anello, lock, stop, csv_file=None, quiet=False):
+    """Fusione, log CSV, aggregazione e console in un processo dedicato.
+
+    Ctrl-C arriva a tutto il gruppo di processi: il worker lo ignora e termina
+    solo con stop, dopo aver svuotato l'anello.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if csv_file:
+        completo.CSV_FILE = csv_file
+        completo.aggregatore = AggregatoreVento(csv_file, completo.AGG_FINESTRE_S)
+    completo.ensured_log()
+    completo.aggregatore.ensured_headers()
+    anello = AnelloCampioni(nome_anello, lock=lock)
+    with contextlib.ExitStack() as stack:
+        if quiet:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        try:
+            while True:
+                campioni = anello.pop_tutti()
+                for campione in campioni:
+                    applica_campione(campione)
+                if not campioni:
+                    if stop.is_set() and anello.in_coda() == 0:
+                        break
+                    time.sleep(POLL_S)
+        finally:
+            completo.aggregatore.chiudi()
+            if completo.log_compresso is not None:
+                completo.log_compresso.close()
+            anello.close()
+
+
+ROLI_WORKER = {
+    "fusione": worker_fusione,
+}
+
+
+def avvia_worker(ruoli, csv_file=None, quiet=False):
+    """Crea un anello per ogni worker e avvia i processi; restituisce (anelli, processi, stop)."""
+    stop = mp.Event()
+    anelli = []
+    processi = []
+    for ruolo in ruoli:
+        anello = AnelloCampioni()
+        p = mp.Process(target=ROLI_WORKER[ruolo], args=(anello.nome, anello.lock, stop, csv_file, quiet),
+                       name=f"worker-{ruolo}", daemon=True)
+        p.start()
+        anelli.append(anello)
+        processi.append(p)
+    return anelli, processi, stop
+
+
+def ferma_worker(anelli, processi, stop):
+    stop.set()
+    for p in processi:
+        p.join()
+    for anello in anelli:
+        anello.close()
+
+
+# ----------------- INGESTIONE -----------------
+def handler_ingestione(anelli):
+    """Handler per completo.main() che copiano ogni lettura negli anelli dei worker."""
+
+    def push(tipo, *valori):
+        t = time.time()
+        for anello in anelli:
+            anello.push(tipo, t, *valori)
+
+    def on_fix(lat, lon, spd):
+        push(GPS, lat, lon, spd)
+
+    def on_frame(sender, data: bytes):
+        frame = completo.decode_wt901_frame(data)
+        if frame is not None:
+            push(ACC if frame[0] == 'acc' else MAG, *frame[1])
+
+    def on_reading(reading):
+        push(VENTO, reading.wind_speed, reading.wind_direction)
+
+    return on_fix, on_frame, on_reading
+
+
+# ----------------- BENCHMARK -----------------
+def campioni_sintetici(n):
+    """Sequenza di letture grezze nella proporzione GPS 10 Hz, WT901 100 Hz, Calypso 8 Hz."""
+    import generatore_carico as gc
+    out = []
+    for k in range(n):
+        t = k / 118.0
+        r = k % 118
+        if r < 10:
+            lat, lon, _, spd = gc.posizione(t)
+            out.append(("gps", (lat, lon, spd)))
+        elif r < 18:
+            out.append(("calypso", gc.lettura_calypso(t)))
+        elif r % 2:
+            out.append(("wt901", gc.frame_wt901_acc(random.gauss(0.0, 0.02), random.gauss(0.0, 0.02), 1.0)))
+        else:
+            _, _, cog, _ = gc.posizione(t)
+            out.append(("wt901", gc.frame_wt901_mag(*gc.campo_magnetico(cog))))
+    return out
+
+
+def esegui_campioni(campioni, on_fix, on_frame, on_reading):
+    for tipo, v in campioni:
+        if tipo == "gps":
+            on_fix(*v)
+        elif tipo == "wt901":
+            on_frame(None, v)
+        else:
+            on_reading(v)
+
+
+def bench(n, csv_base):
+    campioni = campioni_sintetici(n)
+    # il worker parte prima del test a processo singolo per non ereditarne lo stato
+    anelli, processi, stop = avvia_worker(["fusione"], csv_base + "_mp.csv", quiet=True)
+
+    # processo singolo: tutto nel thread dell'ingestione
+    completo.CSV_FILE = csv_base + "_single.csv"
+    completo.aggregatore = AggregatoreVento(completo.CSV_FILE, completo.AGG_FINESTRE_S)
+    completo.ensured_log()
+    completo.aggregatore.ensured_headers()
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        t0 = time.perf_counter()
+        esegui_campioni(campioni, completo.apply_gps_fix, completo.wt901_handle, completo.process_reading)
+        dt_single = time.perf_counter() - t0
+    completo.aggregatore.chiudi()
+    if completo.log_compresso is not None:
+        completo.log_compresso.close()
+
+    # multi-processo: l'ingestione copia nell'anello, il worker elabora
+    anello = anelli[0]
+    on_fix, on_frame, on_reading = handler_ingestione(anelli)
+    dt_ingest = 0.0     # solo le chiamate agli handler, senza le attese
+    t0 = time.perf_counter()
+    for blocco in range(0, n, anello.slot // 2):
+        # il benchmark non deve perdere campioni: aspetta spazio nell'anello
+        while anello.in_coda() > anello.slot // 2:
+            time.sleep(POLL_S)
+        t1 = time.perf_counter()
+        esegui_campioni(campioni[blocco:blocco + anello.slot // 2], on_fix, on_frame, on_reading)
+        dt_ingest += time.perf_counter() - t1
+    while anello.letti() < n:
+        time.sleep(POLL_S)
+    dt_mp = time.perf_counter() - t0
+    dt_attesa = dt_mp - dt_ingest
+    persi = anello.persi
+    ferma_worker(anelli, processi, stop)
+
+    print(f"{'modalita':<28} {'campioni/s':>12} {'us/campione':>12}")
+    print(f"{'processo singolo':<28} {n / dt_single:>12.0f} {dt_single / n * 1e6:>12.1f}")
+    print(f"{'multi-processo end-to-end':<28} {n / dt_mp:>12.0f} {dt_mp / n * 1e6:>12.1f}")
+    print(f"{'multi-processo ingestione':<28} {n / dt_ingest:>12.0f} {dt_ingest / n * 1e6:>12.1f}")
+    print(f"⏳ attesa del worker (anello pieno o da svuotare): {dt_attesa:.2f}s su {dt_mp:.2f}s")
+    print(f"📉 campioni persi ad anello pieno: {persi}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Acquisizione multi-processo con anello in memoria condivisa")
+    ap.add_argument("--worker", action="append", choices=sorted(ROLI_WORKER),
+                    help="ruolo del worker (ripetibile, default: fusione)")
+    ap.add_argument("--bench", type=int, metavar="N", help="confronta processo singolo e multi-processo su N campioni")
+    ap.add_argument("--bench-csv", default="bench_vento",
+                    help="prefisso dei CSV del benchmark (fuori dal glob vento_compensato*.csv delle sessioni)")
+    args = ap.parse_args()
+    # due worker con lo stesso ruolo scriverebbero due volte le stesse righe
+    doppi = sorted({r for r in args.worker or [] if args.worker.count(r) > 1})
+    if doppi:
+        ap.error(f"ruolo ripetuto in --worker: {', '.join(doppi)}")
+
+    if args.bench:
+        bench(args.bench, args.bench_csv)
+        return
+
+    anelli, processi, stop = avvia_worker(args.worker or ["fusione"])
+    on_fix, on_frame, on_reading = handler_ingestione(anelli)
+    print(f"🧵 Ingestione nel processo {os.getpid()}, worker: {', '.join(p.name for p in processi)}")
+    try:
+        asyncio.run(completo.main(on_fix=on_fix, on_frame=on_frame, on_reading=on_reading))
+    except KeyboardInterrupt:
+        print("🛑 Interrotto dall'utente.")
+    finally:
+        for anello in anelli:
+            if anello.persi:
+                print(f"📉 {anello.persi} campioni persi ad anello pieno")
+        ferma_worker(anelli, processi, stop)
+
+
+if __name__ == "__main__":
+    main()
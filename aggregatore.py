@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Aggregazione in streaming delle letture vento su finestre scorrevoli (1s, 10s, 60s).
+
+Gli angoli apparenti aggregati sono quelli corretti (AWA_corr_deg del log),
+da cui derivano TWS/TWA.
+"""
+import csv
+import math
+import os
+import re
+from collections import deque
+
+# ----------------- CONFIG -----------------
+# durata delle finestre scorrevoli (s); ogni finestra scrive anche un file di riepilogo
+FINESTRE_S = (1, 10, 60)
+
+SUMMARY_HEADER = ["timestamp", "window_s", "n",
+                  "AWS_mean_kn", "AWS_gust_kn", "AWA_corr_circ_deg", "AWA_corr_vec_deg",
+                  "TWS_mean_kn", "TWS_gust_kn", "TWA_circ_deg", "TWA_vec_deg"]
+
+# indici delle somme correnti mantenute da ogni finestra
+_AWS, _AWA_SIN, _AWA_COS, _AWA_VSIN, _AWA_VCOS, _TWS, _TWA_SIN, _TWA_COS, _TWA_VSIN, _TWA_VCOS = range(10)
+
+
+def angolo_da_componenti(s, c):
+    """Angolo 0-360 da somma di seni/coseni; None se il vettore risultante e' nullo."""
+    if abs(s) < 1e-12 and abs(c) < 1e-12:
+        return None
+    return round((math.degrees(math.atan2(s, c)) + 360.0) % 360.0, 2) % 360.0
+
+
+class FinestraScorrevole:
+    """Finestra temporale scorrevole su AWS/AWA/TWS/TWA con aggiornamento O(1) ammortizzato.
+
+    Le medie usano somme correnti (sommate all'ingresso, sottratte all'uscita),
+    le raffiche un deque monotono decrescente per il massimo della finestra.
+    """
+
+    def __init__(self, durata_s):
+        self.durata_s = durata_s
+        self.campioni = deque()     # (t, componenti)
+        self.somme = [0.0] * 10
+        self.max_aws = deque()      # (t, aws) con aws decrescente
+        self.max_tws = deque()      # (t, tws) con tws decrescente
+
+    @staticmethod
+    def _push_max(dq, t, v):
+        while dq and dq[-1][1] <= v:
+            dq.pop()
+        dq.append((t, v))
+
+    def aggiungi(self, t, aws, awa_deg, tws, twa_deg):
+        # awa_deg: angolo apparente corretto (AWA_corr_deg)
+        awa = math.radians(awa_deg)
+        twa = math.radians(twa_deg)
+        comp = (aws, math.sin(awa), math.cos(awa), aws * math.sin(awa), aws * math.cos(awa),
+                tws, math.sin(twa), math.cos(twa), tws * math.sin(twa), tws * math.cos(twa))
+        self.campioni.append((t, comp))
+        for i, v in enumerate(comp):
+            self.somme[i] += v
+        self._push_max(self.max_aws, t, aws)
+        self._push_max(self.max_tws, t, tws)
+        self.scorri(t)
+
+    def scorri(self, t):
+        """Elimina i campioni con timestamp < t - durata_s (finestra semiaperta [t - durata_s, t))."""
+        limite = t - self.durata_s
+        while self.campioni and self.campioni[0][0] < limite:
+            _, comp = self.campioni.popleft()
+            for i, v in enumerate(comp):
+                self.somme[i] -= v
+        while self.max_aws and self.max_aws[0][0] < limite:
+            self.max_aws.popleft()
+        while self.max_tws and self.max_tws[0][0] < limite:
+            self.max_tws.popleft()
+        if not self.campioni:
+            # finestra vuota: azzera per non accumulare errori di arrotondamento
+            self.somme = [0.0] * 10
+
+    def riepilogo(self):
+        """Dizionario con medie, medie circolari/vettoriali e raffiche; None se vuota."""
+        n = len(self.campioni)
+        if n == 0:
+            return None
+        s = self.somme
+
+        def r(x):
+            return round(x, 2) if x is not None else ""
+
+        return {
+            "window_s": self.durata_s,
+            "n": n,
+            "AWS_mean_kn": r(s[_AWS] / n),
+            "AWS_gust_kn": r(self.max_aws[0][1]),
+            "AWA_corr_circ_deg": r(angolo_da_componenti(s[_AWA_SIN], s[_AWA_COS])),
+            "AWA_corr_vec_deg": r(angolo_da_componenti(s[_AWA_VSIN], s[_AWA_VCOS])),
+            "TWS_mean_kn": r(s[_TWS] / n),
+            "TWS_gust_kn": r(self.max_tws[0][1]),
+            "TWA_circ_deg": r(angolo_da_componenti(s[_TWA_SIN], s[_TWA_COS])),
+            "TWA_vec_deg": r(angolo_da_componenti(s[_TWA_VSIN], s[_TWA_VCOS])),
+        }
+
+
+def summary_path(csv_file, durata_s):
+    """vento_compensato.csv -> vento_compensato_10s.csv"""
+    base, ext = os.path.splitext(csv_file)
+    return f"{base}_{durata_s}s{ext or '.csv'}"
+
+
+def is_summary_path(path):
+    """True per i riepiloghi scritti da summary_path (vento_compensato_10s.csv)."""
+    return re.search(r"_\d+s\.csv$", os.path.basename(path)) is not None
+
+
+class AggregatoreVento:
+    """Mantiene piu' finestre scorrevoli e scrive un riepilogo decimato per ciascuna.
+
+    Ogni finestra emette una riga ogni durata_s secondi (allineata ai multipli
+    di durata_s) nel file summary_path(csv_file, durata_s).
+    """
+
+    def __init__(self, csv_file, finestre_s=FINESTRE_S):
+        self.finestre = [FinestraScorrevole(d) for d in finestre_s]
+        self.paths = {d: summary_path(csv_file, d) for d in finestre_s}
+        self.prossima_emissione = {d: None for d in finestre_s}
+
+    def ensured_headers(self):
+        for path in self.paths.values():
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                with open(path, "w", newline="") as f:
+                    csv.writer(f).writerow(SUMMARY_HEADER)
+
+    def aggiungi(self, t, aws, awa_deg, tws, twa_deg):
+        for fin in self.finestre:
+            d = fin.durata_s
+            if self.prossima_emissione[d] is None:
+                self.prossima_emissione[d] = (math.floor(t / d) + 1) * d
+            elif t >= self.prossima_emissione[d]:
+                # chiudi l'intervallo precedente prima di inserire il nuovo campione
+                fin.scorri(self.prossima_emissione[d])
+                self._scrivi(fin, self.prossima_emissione[d])
+                self.prossima_emissione[d] = (math.floor(t / d) + 1) * d
+            fin.aggiungi(t, aws, awa_deg, tws, twa_deg)
+
+    def chiudi(self):
+        """Scrive le finestre ancora aperte (fine sessione o perdita del segnale).
+
+        La riga porta il timestamp del confine successivo, come le altre, anche
+        se l'intervallo non e' completo.
+        """
+        for fin in self.finestre:
+            d = fin.durata_s
+            if self.prossima_emissione[d] is None:
+                continue
+            fin.scorri(self.prossima_emissione[d])
+            self._scrivi(fin, self.prossima_emissione[d])
+            self.prossima_emissione[d] = None
+
+    def _scrivi(self, fin, t):
+        riga = fin.riepilogo()
+        if riga is None:
+            return
+        riga["timestamp"] = int(t) if float(t).is_integer() else round(t, 3)
+        with open(self.paths[fin.durata_s], "a", newline="") as f:
+            csv.writer(f).writerow([riga[k] for k in SUMMARY_HEADER])
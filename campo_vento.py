@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Campo di vento su griglia spaziale aggregato da piu' sessioni.
+
+Ogni sessione viene ridotta (con NumPy, senza cicli per riga) a una griglia di
+celle metriche fisse con: numero di campioni, somma vettoriale del vento reale
+(direzione media), somme di TWS e istogramma di TWS (percentili). Le griglie di
+sessioni diverse si fondono sommando cella per cella e vengono salvate accanto
+alla sessione (.griglia.npz), cosi' aggiungere una sessione costa solo quella.
+La mappa e' un unico layer GeoJSON (celle colorate per TWS + frecce), non un
+marker per ogni punto.
+"""
+import argparse
+import glob
+import math
+import os
+
+import numpy as np
+
+from aggregatore import is_summary_path
+from log_compresso import apri_log, index_path, is_compresso
+
+# ----------------- CONFIG -----------------
+CELLA_M = 250.0             # lato della cella (m)
+LAT_RIF = 45.46             # latitudine di riferimento della zona (scala delle longitudini)
+BIN_KN = 0.5                # risoluzione dell'istogramma di TWS
+N_BIN = 120                 # 0..60 kn, l'ultimo bin raccoglie i valori oltre
+MIN_CAMPIONI = 5            # celle con meno campioni non vengono disegnate
+PERCENTILE = 90
+
+OUT_HTML = "campo_vento.html"
+PATTERNS = ("vento_compensato*.csv", "vento_compensato*.csv.gz", "vento_compensato*.csv.zst")
+
+M_PER_DEG = 111320.0
+_J_OFFSET = 1 << 31
+
+
+def chiavi_celle(lat, lon, cella_m=CELLA_M, lat_rif=LAT_RIF):
+    """Chiave int64 della cella (riga << 32 | colonna) per ogni punto."""
+    i = np.floor(lat * M_PER_DEG / cella_m).astype(np.int64)
+    j = np.floor(lon * M_PER_DEG * math.cos(math.radians(lat_rif)) / cella_m).astype(np.int64)
+    return (i << 32) | (j + _J_OFFSET)
+
+
+def celle_da_chiavi(chiavi):
+    i = chiavi >> 32
+    j = (chiavi & 0xFFFFFFFF) - _J_OFFSET
+    return i, j
+
+
+class GrigliaVento:
+    """Statistiche del vento reale per cella, fondibili tra sessioni."""
+
+    CAMPI = ("chiavi", "n", "sum_u", "sum_v", "sum_tws", "sum_tws2", "hist")
+
+    def __init__(self, chiavi, n, sum_u, sum_v, sum_tws, sum_tws2, hist,
+                 cella_m=CELLA_M, lat_rif=LAT_RIF):
+        self.chiavi = chiavi
+        self.n = n
+        self.sum_u = sum_u
+        self.sum_v = sum_v
+        self.sum_tws = sum_tws
+        self.sum_tws2 = sum_tws2
+        self.hist = hist
+        self.cella_m = cella_m
+        self.lat_rif = lat_rif
+        self.sorgente = None    # [size, mtime_ns] dei file di sessione, se caricata da cache
+
+    @classmethod
+    def vuota(cls, cella_m=CELLA_M, lat_rif=LAT_RIF):
+        z = np.zeros(0)
+        return cls(np.zeros(0, np.int64), np.zeros(0, np.int64), z, z, z, z,
+                   np.zeros((0, N_BIN), np.int64), cella_m, lat_rif)
+
+    @classmethod
+    def da_campioni(cls, lat, lon, direzione_deg, tws, cella_m=CELLA_M, lat_rif=LAT_RIF):
+        """Griglia da array di punti: direzione del vento reale rispetto al Nord e TWS (kn)."""
+        if len(lat) == 0:
+            return cls.vuota(cella_m, lat_rif)
+        chiavi, inv = np.unique(chiavi_celle(lat, lon, cella_m, lat_rif), return_inverse=True)
+        m = len(chiavi)
+        rad = np.radians(direzione_deg)
+        b = np.minimum((tws / BIN_KN).astype(np.int64), N_BIN - 1)
+        hist = np.bincount(inv * N_BIN + b, minlength=m * N_BIN).reshape(m, N_BIN)
+        return cls(
+            chiavi,
+            np.bincount(inv, minlength=m),
+            np.bincount(inv, weights=tws * np.sin(rad), minlength=m),
+            np.bincount(inv, weights=tws * np.cos(rad), minlength=m),
+            np.bincount(inv, weights=tws, minlength=m),
+            np.bincount(inv, weights=tws * tws, minlength=m),
+            hist, cella_m, lat_rif,
+        )
+
+    @classmethod
+    def fondi(cls, griglie):
+        """Somma cella per cella di piu' griglie con la stessa geometria."""
+        griglie = list(griglie)
+        if not griglie:
+            return cls.vuota()
+        g0 = griglie[0]
+        for g in griglie[1:]:
+            if (g.cella_m, g.lat_rif) != (g0.cella_m, g0.lat_rif):
+                raise ValueError("Griglie con geometria diversa: impossibile fonderle")
+        tutte = np.concatenate([g.chiavi for g in griglie])
+        chiavi, inv = np.unique(tutte, return_inverse=True)
+        m = len(chiavi)
+
+        def somma(campo):
+            return np.bincount(inv, weights=np.concatenate([getattr(g, campo) for g in griglie]), minlength=m)
+
+        hist = np.zeros((m, N_BIN), np.int64)
+        np.add.at(hist, inv, np.concatenate([g.hist for g in griglie]))
+        return cls(chiavi, somma("n").astype(np.int64), somma("sum_u"), somma("sum_v"),
+                   somma("sum_tws"), somma("sum_tws2"), hist, g0.cella_m, g0.lat_rif)
+
+    # ----- statistiche per cella -----
+    def direzione_media(self):
+        """Direzione media vettoriale (pesata per TWS), 0-360 rispetto al Nord."""
+        return (np.degrees(np.arctan2(self.sum_u, self.sum_v)) + 360.0) % 360.0
+
+    def tws_media(self):
+        return self.sum_tws / np.maximum(self.n, 1)
+
+    def tws_dev(self):
+        media = self.tws_media()
+        return np.sqrt(np.maximum(self.sum_tws2 / np.maximum(self.n, 1) - media * media, 0.0))
+
+    def tws_percentile(self, p):
+        """Percentile di TWS dall'istogramma (centro del bin)."""
+        cum = np.cumsum(self.hist, axis=1)
+        soglia = np.ceil(p / 100.0 * self.n)[:, None]
+        idx = np.argmax(cum >= np.maximum(soglia, 1), axis=1)
+        return (idx + 0.5) * BIN_KN
+
+    def costanza(self):
+        """Rapporto tra vento medio vettoriale e TWS medio (1 = direzione costante)."""
+        return np.hypot(self.sum_u, self.sum_v) / np.maximum(self.sum_tws, 1e-9)
+
+    def centri(self):
+        """Centri (lat, lon) delle celle."""
+        i, j = celle_da_chiavi(self.chiavi)
+        lat = (i + 0.5) * self.cella_m / M_PER_DEG
+        lon = (j + 0.5) * self.cella_m / (M_PER_DEG * math.cos(math.radians(self.lat_rif)))
+        return lat, lon
+
+    # ----- persistenza -----
+    def salva(self, path, sorgente=()):
+        """sorgente: [size, mtime_ns] dei file da cui e' calcolata, confrontati al caricamento."""
+        np.savez_compressed(path, cella_m=self.cella_m, lat_rif=self.lat_rif, bin_kn=BIN_KN, n_bin=N_BIN,
+                            sorgente=np.array(sorgente, dtype=np.int64).reshape(-1, 2),
+                            **{k: getattr(self, k) for k in self.CAMPI})
+
+    @classmethod
+    def carica(cls, path):
+        with np.load(path) as z:
+            if float(z["bin_kn"]) != BIN_KN or int(z["n_bin"]) != N_BIN:
+                raise ValueError(f"Istogramma di {path} con parametri diversi")
+            g = cls(*(z[k] for k in cls.CAMPI), cella_m=float(z["cella_m"]), lat_rif=float(z["lat_rif"]))
+            g.sorgente = z["sorgente"].tolist() if "sorgente" in z.files else None
+            return g
+
+
+# ----------------- SESSIONI -----------------
+def _colonna(valori):
+    return np.array([v if v not in ("", None) else "nan" for v in valori], dtype=float)
+
+
+def leggi_sessione(path, t_start=None, t_end=None):
+    """Array (lat, lon, direzione vento reale rispetto al Nord, TWS) dei punti validi di una sessione."""
+    fieldnames, righe = apri_log(path, t_start, t_end)
+    nomi = ("lat", "lon", "heading_gps", "TWA_deg", "TWS_kn")
+    mancanti = [c for c in nomi if c not in fieldnames]
+    if mancanti:
+        raise ValueError(f"Colonne mancanti in {path}: {mancanti}")
+    colonne = {c: [] for c in nomi}
+    for row in righe:
+        for c in nomi:
+            colonne[c].append(row[c])
+    lat, lon, hdg, twa, tws = (_colonna(colonne[c]) for c in nomi)
+    ok = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(hdg) & np.isfinite(twa) & np.isfinite(tws)
+    ok &= (lat != 0) & (lon != 0) & (tws >= 0)
+    # vento reale rispetto al Nord, come tws_nord in test_mappa6.py
+    direzione = (twa[ok] + hdg[ok]) % 360.0
+    return lat[ok], lon[ok], direzione, tws[ok]
+
+
+def griglia_path(path):
+    return path + ".griglia.npz"
+
+
+def stat_sessione(path):
+    """[size, mtime_ns] dei file della sessione (dati + indice per i log compressi)."""
+    out = []
+    for p in ([path, index_path(path)] if is_compresso(path) else [path]):
+        st = os.stat(p)
+        out.append([st.st_size, st.st_mtime_ns])
+    return out
+
+
+def griglia_sessione(path, cella_m=CELLA_M, lat_rif=LAT_RIF):
+    """Griglia di una sessione, riusando quella salvata se size e mtime della sessione non sono cambiati.
+
+    Il confronto e' di uguaglianza e non "piu' recente": una sessione
+    sostituita con una copia piu' vecchia (cp -p, rsync -a) invalida la cache.
+    """
+    cache = griglia_path(path)
+    stat = stat_sessione(path)
+    if os.path.exists(cache):
+        try:
+            g = GrigliaVento.carica(cache)
+            if (g.cella_m, g.lat_rif) == (cella_m, lat_rif) and g.sorgente == stat:
+                return g
+        except (OSError, ValueError, KeyError):
+            pass
+    g = GrigliaVento.da_campioni(*leggi_sessione(path), cella_m=cella_m, lat_rif=lat_rif)
+    try:
+        g.salva(cache, stat)
+    except OSError as e:
+        # cartella in sola lettura: la griglia si ricalcola alla prossima esecuzione
+        print(f"⚠️ Griglia non salvata per {path}: {e}")
+    return g
+
+
+def trova_sessioni(percorsi):
+    out = []
+    for p in percorsi:
+        if os.path.isdir(p):
+            # i riepiloghi vento_compensato_<N>s.csv di aggregatore.py non sono sessioni
+            out.extend(f for pat in PATTERNS for f in glob.glob(os.path.join(p, pat))
+                       if not is_summary_path(f))
+        else:
+            out.append(p)
+    return sorted(set(out))
+
+
+# ----------------- MAPPA -----------------
+def _sposta(lat, lon, dist_m, bearing_rad, lat_rif=LAT_RIF):
+    """Punto [lon, lat] a dist_m metri lungo bearing_rad (approssimazione piana, celle piccole)."""
+    return [lon + dist_m * math.sin(bearing_rad) / (M_PER_DEG * math.cos(math.radians(lat_rif))),
+            lat + dist_m * math.cos(bearing_rad) / M_PER_DEG]
+
+
+def feature_collection(g, min_campioni=MIN_CAMPIONI, percentile=PERCENTILE):
+    """GeoJSON con un poligono per cella (colore = TWS medio) e una freccia per la direzione media."""
+    sel = g.n >= min_campioni
+    lat_c, lon_c = g.centri()
+    dlat = g.cella_m / M_PER_DEG / 2.0
+    dlon = g.cella_m / (M_PER_DEG * math.cos(math.radians(g.lat_rif))) / 2.0
+    direzione = g.direzione_media()
+    media = g.tws_media()
+    pct = g.tws_percentile(percentile)
+    costanza = g.costanza()
+
+    features = []
+    for k in np.flatnonzero(sel):
+        la, lo, d = float(lat_c[k]), float(lon_c[k]), math.radians(direzione[k])
+        props = {
+            "n": int(g.n[k]),
+            "dir_deg": round(float(direzione[k]), 1),
+            "tws_mean_kn": round(float(media[k]), 2),
+            f"tws_p{percentile}_kn": round(float(pct[k]), 2),
+            "costanza": round(float(costanza[k]), 2),
+        }
+        features.append({
+            "type": "Feature",
+            "properties": dict(props, tipo="cella"),
+            "geometry": {"type": "Polygon", "coordinates": [[
+                [lo - dlon, la - dlat], [lo + dlon, la - dlat], [lo + dlon, la + dlat],
+                [lo - dlon, la + dlat], [lo - dlon, la - dlat]]]},
+        })
+        # freccia verso la direzione media, lunga 0.8 celle (come la freccia di make_arrow_icon)
+        lung = 0.4 * g.cella_m
+        coda = _sposta(la, lo, lung, d + math.pi, g.lat_rif)
+        punta = _sposta(la, lo, lung, d, g.lat_rif)
+        ali = [_sposta(punta[1], punta[0], 0.4 * lung, d + math.pi + a, g.lat_rif) for a in (0.5, -0.5)]
+        features.append({
+            "type": "Feature",
+            "properties": dict(props, tipo="freccia"),
+            "geometry": {"type": "MultiLineString", "coordinates": [[coda, punta], [ali[0], punta, ali[1]]]},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def genera_mappa(g, out_html=OUT_HTML, min_campioni=MIN_CAMPIONI, percentile=PERCENTILE):
+    import folium
+    from branca.colormap import LinearColormap
+
+    sel = g.n >= min_campioni
+    if not sel.any():
+        raise ValueError("Nessuna cella con abbastanza campioni")
+    lat_c, lon_c = g.centri()
+    media = g.tws_media()[sel]
+    scala = LinearColormap(["blue", "green", "yellow", "red"], vmin=float(media.min()),
+                           vmax=max(float(media.max()), float(media.min()) + 1.0), caption="TWS medio (kn)")
+
+    def stile(feature):
+        p = feature["properties"]
+        if p["tipo"] == "freccia":
+            return {"color": "black", "weight": 2}
+        return {"fillColor": scala(p["tws_mean_kn"]), "color": None, "weight": 0, "fillOpacity": 0.55}
+
+    m = folium.Map(location=[float(lat_c[sel].mean()), float(lon_c[sel].mean())], zoom_start=13)
+    folium.GeoJson(
+        feature_collection(g, min_campioni, percentile),
+        name="Campo di vento",
+        style_function=stile,
+        tooltip=folium.GeoJsonTooltip(fields=["n", "dir_deg", "tws_mean_kn", f"tws_p{percentile}_kn", "costanza"]),
+    ).add_to(m)
+    scala.add_to(m)
+    m.save(out_html)
+    print(f"✅ Campo di vento salvato come '{out_html}' ({int(sel.sum())} celle, {int(g.n.sum())} campioni)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Campo di vento su griglia da piu' sessioni")
+    ap.add_argument("sessioni", nargs="+", help="file di sessione o cartelle")
+    ap.add_argument("-o", "--out", default=OUT_HTML)
+    ap.add_argument("--cella-m", type=float, default=CELLA_M)
+    ap.add_argument("--min-campioni", type=int, default=MIN_CAMPIONI)
+    ap.add_argument("--percentile", type=int, default=PERCENTILE)
+    args = ap.parse_args()
+
+    griglie = []
+    for path in trova_sessioni(args.sessioni):
+        try:
+            griglie.append(griglia_sessione(path, args.cella_m))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Sessione saltata: {e}")
+    g = GrigliaVento.fondi(griglie)
+    print(f"🧮 {len(griglie)} sessioni, {len(g.chiavi)} celle")
+    genera_mappa(g, args.out, args.min_campioni, args.percentile)
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,10 @@ import calypso_anemometer.exception
 
 from bleak import BleakScanner, BleakClient
 
+from aggregatore import AggregatoreVento
+from geo import haversine_m
+from log_compresso import ChunkedLogWriter
+
 # ----------------- CONFIG -----------------
 GPS_PORT = "/dev/serial0"     # regola se necessario
 GPS_BAUDRATE = 9600
@@ -27,6 +31,16 @@ CHAR_NOTIFY = "0000ffe4-0000-1000-8000-00805f9a34fb"
 CHAR_WRITE  = "0000ffe9-0000-1000-8000-00805f9a34fb"
 
 CSV_FILE = "vento_compensato.csv"
+CSV_HEADER = ["timestamp", "lat", "lon", "gps_speed_kn", "heading_gps",
+              "heading_mag", "shift_deg", "AWS_kn", "AWA_deg", "AWA_corr_deg", "TWS_kn", "TWA_deg"]
+
+# log compresso a blocchi (CSV_FILE + ".gz" con indice ".gz.idx") al posto del CSV in chiaro
+# (usa ".zst" se e' installato il modulo zstandard)
+CSV_COMPRESSO = False
+CSV_COMPRESSO_EXT = ".gz"
+
+# finestre scorrevoli (s) per i riepiloghi decimati vento_compensato_<N>s.csv
+AGG_FINESTRE_S = (1, 10, 60)
 
 # soglia minima distanza per calcolare bearing GPS (m)
 GPS_MIN_DIST_M = 5.0
@@ -42,18 +56,11 @@ latest_acc = {'x': 0.0, 'y': 0.0, 'z': 0.0}   # in g (approssimato)
 latest_mag = {'x': 0.0, 'y': 0.0, 'z': 0.0}   # in uT
 heading_mag = None
 
-# ----------------- UTIL -----------------
-def haversine_m(lat1, lon1, lat2, lon2):
-    """Return distance in meters between two lat/lon points."""
-    R = 6371000.0
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+# aggregazione in streaming (1s/10s/60s)
+aggregatore = AggregatoreVento(CSV_FILE, AGG_FINESTRE_S)
+log_compresso = None
 
+# ----------------- UTIL -----------------
 def bearing_between(lat1, lon1, lat2, lon2):
     """Initial bearing from point 1 to 2 in degrees 0-360 (north-based)."""
     y = math.sin(math.radians(lon2 - lon1)) * math.cos(math.radians(lat2))
@@ -66,17 +73,66 @@ def ensured_csv_header(path):
     if not os.path.exists(path) or os.path.getsize(path) == 0:
         with open(path, "w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["timestamp", "lat", "lon", "gps_speed_kn", "heading_gps",
-                             "heading_mag", "shift_deg", "AWS_kn", "AWA_deg", "AWA_corr_deg", "TWS_kn", "TWA_deg"])
+            writer.writerow(CSV_HEADER)
+
+def ensured_log():
+    """Prepara il log di sessione: CSV in chiaro oppure compresso a blocchi."""
+    global log_compresso
+    if not CSV_COMPRESSO:
+        ensured_csv_header(CSV_FILE)
+    elif log_compresso is None:
+        log_compresso = ChunkedLogWriter(CSV_FILE + CSV_COMPRESSO_EXT, CSV_HEADER)
 
 # ----------------- GPS Task -----------------
-async def gps_reader():
+# ultimo punto usato per il bearing GPS
+gps_prev = {'lat': None, 'lon': None, 'time': None}
+
+def decode_nmea_rmc(line):
+    """Decodifica una frase RMC valida: (lat, lon, velocita' kn) oppure None."""
+    if not (line.startswith("$GNRMC") or line.startswith("$GPRMC")):
+        return None
+    try:
+        msg = pynmea2.parse(line)
+    except pynmea2.ParseError:
+        return None
+    if getattr(msg, "status", None) != 'A':
+        # no fix
+        return None
+    try:
+        return msg.latitude, msg.longitude, float(msg.spd_over_grnd)  # nodi
+    except Exception:
+        return None
+
+def apply_gps_fix(lat, lon, spd):
     global boat_speed_knots, latitude, longitude, heading_gps
-    prev_lat = None
-    prev_lon = None
-    prev_time = None
+    # aggiorna globali
+    boat_speed_knots = spd
+    latitude = lat
+    longitude = lon
+
+    # calcola bearing tra precedenti se validi
+    now = datetime.utcnow().timestamp()
+    if gps_prev['lat'] is not None and gps_prev['lon'] is not None:
+        dist = haversine_m(gps_prev['lat'], gps_prev['lon'], lat, lon)
+        # calcola heading GPS se la distanza supera la soglia o la velocità è significativa
+        if dist >= GPS_MIN_DIST_M or boat_speed_knots > 0.5:
+            heading_gps = bearing_between(gps_prev['lat'], gps_prev['lon'], lat, lon)
+            # aggiorna prev
+            gps_prev.update({'lat': lat, 'lon': lon, 'time': now})
+    else:
+        gps_prev.update({'lat': lat, 'lon': lon, 'time': now})
+
+def process_nmea_line(line):
+    """Applica una riga NMEA allo stato condiviso; True se conteneva un fix valido."""
+    fix = decode_nmea_rmc(line)
+    if fix is None:
+        return False
+    apply_gps_fix(*fix)
+    return True
+
+async def gps_reader(port=GPS_PORT, on_fix=apply_gps_fix):
     try:
-        ser = serial.Serial(GPS_PORT, GPS_BAUDRATE, timeout=1)
+        ser = serial.Serial(port, GPS_BAUDRATE, timeout=1)
     except Exception as e:
         print(f"❌ Errore apertura seriale GPS: {e}")
         return
@@ -93,39 +149,11 @@ async def gps_reader():
             continue
 
         if line.startswith("$GNRMC") or line.startswith("$GPRMC"):
-            try:
-                msg = pynmea2.parse(line)
-            except pynmea2.ParseError:
-                continue
-            if getattr(msg, "status", None) != 'A':
-                # no fix
-                await asyncio.sleep(0.1)
-                continue
-            # aggiorna posizione e velocita (nodi)
-            try:
-                lat = msg.latitude
-                lon = msg.longitude
-                spd = float(msg.spd_over_grnd)  # nodi
-            except Exception:
+            fix = decode_nmea_rmc(line)
+            if fix is None:
                 await asyncio.sleep(0.1)
                 continue
-
-            # aggiorna globali
-            boat_speed_knots = spd
-            latitude = lat
-            longitude = lon
-
-            # calcola bearing tra precedenti se validi
-            now = datetime.utcnow().timestamp()
-            if prev_lat is not None and prev_lon is not None:
-                dist = haversine_m(prev_lat, prev_lon, lat, lon)
-                # calcola heading GPS se la distanza supera la soglia o la velocità è significativa
-                if dist >= GPS_MIN_DIST_M or boat_speed_knots > 0.5:
-                    heading_gps = bearing_between(prev_lat, prev_lon, lat, lon)
-                    # aggiorna prev
-                    prev_lat, prev_lon, prev_time = lat, lon, now
-            else:
-                prev_lat, prev_lon, prev_time = lat, lon, now
+            on_fix(*fix)
 
         await asyncio.sleep(0.05)
 
@@ -157,8 +185,52 @@ def compensated_heading_from_acc_mag(ax, ay, az, mx, my, mz):
     heading = math.atan2(my_comp, mx_comp)
     return (math.degrees(heading) + 360) % 360
 
-async def wt901_task():
-    global latest_acc, latest_mag, heading_mag
+def decode_wt901_frame(data: bytes):
+    """Decodifica un pacchetto WT901: ('acc', (x, y, z)) in g, ('mag', (x, y, z)) in uT, oppure None."""
+    # minimal validation
+    if len(data) < 11 or data[0] != 0x55:
+        return None
+    ptype = data[1]
+    if ptype == 0x61:
+        # using mapping used previously (adapt if necessary)
+        # NOTE: user experiments showed ordering differences; keep same mapping
+        az = s16_from_bytes(data[2], data[3]) / 32768.0 * 16.0
+        ay = s16_from_bytes(data[4], data[5]) / 32768.0 * 16.0
+        ax = s16_from_bytes(data[6], data[7]) / 32768.0 * 16.0 * -1.0
+        return 'acc', (ax, ay, az)
+    if ptype == 0x71:
+        # magnetometer: bytes layout observed: start at index 4..9 for Hx,Hy,Hz
+        # depends on single register read format 55 71 regL regH <8 registers...>
+        # many logs used [4:6],[6:8],[8:10]
+        mx = s16_from_bytes(data[4], data[5]) / 150.0
+        my = s16_from_bytes(data[6], data[7]) / 150.0
+        mz = s16_from_bytes(data[8], data[9]) / 150.0
+        return 'mag', (mx, my, mz)
+    return None
+
+def apply_acc(ax, ay, az):
+    latest_acc.update({'x': ax, 'y': ay, 'z': az})
+
+def apply_mag(mx, my, mz):
+    global heading_mag
+    latest_mag.update({'x': mx, 'y': my, 'z': mz})
+    # compute heading if acc present
+    h = compensated_heading_from_acc_mag(latest_acc['x'], latest_acc['y'], latest_acc['z'], mx, my, mz)
+    if h is not None:
+        heading_mag = h
+
+def wt901_handle(sender, data: bytes):
+    """Handler delle notifiche BLE del WT901."""
+    frame = decode_wt901_frame(data)
+    if frame is None:
+        return
+    kind, values = frame
+    if kind == 'acc':
+        apply_acc(*values)
+    else:
+        apply_mag(*values)
+
+async def wt901_task(on_frame=wt901_handle):
     backoff = 2
     while True:
         # Cerca WT901
@@ -185,44 +257,7 @@ async def wt901_task():
                 await client.write_gatt_char(CHAR_WRITE, bytearray([0xFF, 0xAA, 0x00, 0x00, 0x00]))
                 await asyncio.sleep(0.1)
 
-                # notification handler
-                def handle(sender, data: bytes):
-                    nonlocal client
-                    # minimal validation
-                    if len(data) < 11 or data[0] != 0x55:
-                        return
-                    ptype = data[1]
-                    if ptype == 0x61:
-                        # using mapping used previously (adapt if necessary)
-                        # NOTE: user experiments showed ordering differences; keep same mapping
-                        az = s16_from_bytes(data[2], data[3]) / 32768.0 * 16.0
-                        ay = s16_from_bytes(data[4], data[5]) / 32768.0 * 16.0
-                        ax = s16_from_bytes(data[6], data[7]) / 32768.0 * 16.0 * -1.0
-                        latest_acc.update({'x': ax, 'y': ay, 'z': az})
-                    elif ptype == 0x71:
-                        # magnetometer: bytes layout observed: start at index 4..9 for Hx,Hy,Hz
-                        # depends on single register read format 55 71 regL regH <8 registers...>
-                        # many logs used [4:6],[6:8],[8:10]
-                        try:
-                            mx_raw = s16_from_bytes(data[4], data[5])
-                            my_raw = s16_from_bytes(data[6], data[7])
-                            mz_raw = s16_from_bytes(data[8], data[9])
-                            mx = mx_raw / 150.0
-                            my = my_raw / 150.0
-                            mz = mz_raw / 150.0
-                            latest_mag.update({'x': mx, 'y': my, 'z': mz})
-                            # compute heading if acc present
-                            h = compensated_heading_from_acc_mag(latest_acc['x'], latest_acc['y'], latest_acc['z'], mx, my, mz)
-                            if h is not None:
-                                nonlocal_heading = h
-                                # update global
-                                # assign to outer variable
-                                globals_dict = globals()
-                                globals_dict['heading_mag'] = h
-                        except Exception:
-                            pass
-
-                await client.start_notify(CHAR_NOTIFY, handle)
+                await client.start_notify(CHAR_NOTIFY, on_frame)
 
                 print("📡 WT901 notifications attive. Richiedo magnetometro periodicamente...")
                 backoff = 2
@@ -269,47 +304,55 @@ async def find_calypso_address(name=CALYPSO_NAME, timeout=6.0):
     print("❌ Calypso non trovato nella scansione.")
     return None
 
-async def calypso_subscribe(address):
-    ensured_csv_header(CSV_FILE)
-
-    def process_reading(reading: CalypsoReading):
-        global boat_speed_knots, latitude, longitude, heading_gps, heading_mag
-        now = datetime.utcnow()
-        aws_kn = round(reading.wind_speed * 1.943844, 2)  # m/s -> kn
-        awa = reading.wind_direction  # deg
-        gps_spd = boat_speed_knots
-        # compute shift only if both headings available
-        shift = None
-        awa_corr = awa
-        if heading_mag is not None and heading_gps is not None:
-            # shift as difference (mag - gps) as earlier discussed; use user's chosen convention
-            shift = (heading_mag - heading_gps + 360.0) % 360.0
-            awa_corr = (awa + shift) % 360.0
-        # compute TWS/TWA using corrected AWA and GPS speed as boat speed
-        TWS, TWA = calcola_vento_reale(aws_kn, awa_corr, gps_spd)
-        # log
-        ts = int(now.timestamp())
-        lat = latitude if latitude is not None else ""
-        lon = longitude if longitude is not None else ""
-        h_gps = round(heading_gps,2) if heading_gps is not None else ""
-        h_mag = round(heading_mag,2) if heading_mag is not None else ""
-        shift_val = round(shift,2) if shift is not None else ""
-        print(f"{ts},{lat},{lon},{gps_spd},{h_gps},{h_mag},{shift_val},{aws_kn},{awa},{round(awa_corr,2)},{TWS},{TWA}")
+def process_reading(reading: CalypsoReading, now=None):
+    global boat_speed_knots, latitude, longitude, heading_gps, heading_mag
+    # now: istante di acquisizione, se la lettura arriva in ritardo da un altro processo
+    now = now or datetime.utcnow()
+    aws_kn = round(reading.wind_speed * 1.943844, 2)  # m/s -> kn
+    awa = reading.wind_direction  # deg
+    gps_spd = boat_speed_knots
+    # compute shift only if both headings available
+    shift = None
+    awa_corr = awa
+    if heading_mag is not None and heading_gps is not None:
+        # shift as difference (mag - gps) as earlier discussed; use user's chosen convention
+        shift = (heading_mag - heading_gps + 360.0) % 360.0
+        awa_corr = (awa + shift) % 360.0
+    # compute TWS/TWA using corrected AWA and GPS speed as boat speed
+    TWS, TWA = calcola_vento_reale(aws_kn, awa_corr, gps_spd)
+    # log
+    ts = int(now.timestamp())
+    lat = latitude if latitude is not None else ""
+    lon = longitude if longitude is not None else ""
+    h_gps = round(heading_gps,2) if heading_gps is not None else ""
+    h_mag = round(heading_mag,2) if heading_mag is not None else ""
+    shift_val = round(shift,2) if shift is not None else ""
+    print(f"{ts},{lat},{lon},{gps_spd},{h_gps},{h_mag},{shift_val},{aws_kn},{awa},{round(awa_corr,2)},{TWS},{TWA}")
+    row = [ts, lat, lon, gps_spd, h_gps, h_mag, shift_val, aws_kn, awa, round(awa_corr,2), TWS, TWA]
+    if log_compresso is not None:
+        log_compresso.writerow(row)
+    else:
         with open(CSV_FILE, "a", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow([ts, lat, lon, gps_spd, h_gps, h_mag, shift_val, aws_kn, awa, round(awa_corr,2), TWS, TWA])
+            writer.writerow(row)
+    # riepiloghi su finestre scorrevoli
+    aggregatore.aggiungi(now.timestamp(), aws_kn, awa_corr, TWS, TWA)
+
+async def calypso_subscribe(address, on_reading=process_reading):
+    ensured_log()
+    aggregatore.ensured_headers()
 
     # open connection
     print(f"🔗 Connettendo a Calypso {address} ...")
     async with CalypsoDeviceApi(ble_address=address) as calypso:
-        await calypso.subscribe_reading(process_reading)
+        await calypso.subscribe_reading(on_reading)
         await wait_forever()
 
 # ----------------- MAIN -----------------
-async def main():
+async def main(on_fix=apply_gps_fix, on_frame=wt901_handle, on_reading=process_reading):
     # start gps and wt901 tasks
-    gps_t = asyncio.create_task(gps_reader())
-    wt_t = asyncio.create_task(wt901_task())
+    gps_t = asyncio.create_task(gps_reader(on_fix=on_fix))
+    wt_t = asyncio.create_task(wt901_task(on_frame=on_frame))
     # try to find calypso and subscribe (with retries)
     backoff = 2
     while True:
@@ -320,7 +363,7 @@ async def main():
                 await asyncio.sleep(backoff)
                 backoff = min(backoff*2, 60)
                 continue
-            await calypso_subscribe(address)
+            await calypso_subscribe(address, on_reading=on_reading)
             backoff = 2
         except (calypso_anemometer.exception.BluetoothConversationError,
                 calypso_anemometer.exception.BluetoothTimeoutError) as e:
@@ -333,9 +376,14 @@ async def main():
             backoff = min(backoff*2, 60)
 
 if __name__ == "__main__":
-    ensured_csv_header(CSV_FILE)
+    ensured_log()
+    aggregatore.ensured_headers()
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         print("🛑 Interrotto dall'utente.")
+    finally:
+        aggregatore.chiudi()
+        if log_compresso is not None:
+            log_compresso.close()
 
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Esportazione in streaming delle sessioni vento_compensato*.csv in GPX, GeoJSON e KML.
+
+Le righe vengono lette, filtrate e scritte una alla volta tramite generatori,
+quindi la memoria usata non dipende dalla lunghezza della sessione. Il GPX
+porta i dati del vento come estensioni di ogni trkpt; GeoJSON e KML contengono
+la traccia e un punto per campione con i dati del vento (in KML l'icona e'
+ruotata secondo la direzione del vento reale). Piu' file vengono esportati in
+parallelo.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from itertools import islice
+from xml.sax.saxutils import escape
+
+from aggregatore import is_summary_path
+from geo import haversine_m
+from log_compresso import apri_log
+
+# ----------------- CONFIG -----------------
+FORMATI = ("gpx", "geojson", "kml")
+SEMPLIFICA_M = 0.0          # distanza minima tra punti esportati (0 = tutti i punti)
+MIN_PUNTI = 2               # una traccia con meno punti non viene esportata
+REQUIRED_FIELDS = ("timestamp", "lat", "lon")
+VENTO_NS = "urn:ninux:anemometro:vento:1"
+
+# colonne del CSV riportate nei dati del vento (nome CSV -> nome esportato)
+CAMPI_VENTO = {
+    "gps_speed_kn": "sog_kn",
+    "heading_gps": "cog_deg",
+    "heading_mag": "heading_mag_deg",
+    "AWS_kn": "aws_kn",
+    "AWA_deg": "awa_deg",
+    "AWA_corr_deg": "awa_corr_deg",
+    "TWS_kn": "tws_kn",
+    "TWA_deg": "twa_deg",
+}
+
+BUFFER_SCRITTURA = 1 << 16
+
+
+def _float(v):
+    try:
+        x = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(x) else x
+
+
+# ----------------- LETTURA -----------------
+def punti_sessione(path, t_start=None, t_end=None):
+    """Genera i punti validi di una sessione: dict con t, lat, lon, twd_deg e i CAMPI_VENTO presenti."""
+    fieldnames, righe = apri_log(path, t_start, t_end)
+    missing = [c for c in REQUIRED_FIELDS if c not in (fieldnames or [])]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {missing}")
+    for row in righe:
+        lat = _float(row.get("lat"))
+        lon = _float(row.get("lon"))
+        t = _float(row.get("timestamp"))
+        if lat is None or lon is None or t is None or lat == 0 or lon == 0:
+            continue
+        p = {"t": t, "lat": lat, "lon": lon}
+        for campo, nome in CAMPI_VENTO.items():
+            v = _float(row.get(campo))
+            if v is not None:
+                p[nome] = v
+        # vento reale rispetto al Nord, come tws_nord in test_mappa6.py
+        if "twa_deg" in p and "cog_deg" in p:
+            p["twd_deg"] = round((p["twa_deg"] + p["cog_deg"]) % 360.0, 2)
+        yield p
+
+
+def semplifica(punti, tolleranza_m):
+    """Scarta i punti a meno di tolleranza_m dall'ultimo tenuto; conserva sempre il primo e l'ultimo."""
+    if tolleranza_m <= 0:
+        yield from punti
+        return
+    tenuto = None
+    ultimo = None
+    for p in punti:
+        if tenuto is None or haversine_m(tenuto["lat"], tenuto["lon"], p["lat"], p["lon"]) >= tolleranza_m:
+            tenuto = p
+            yield p
+        ultimo = p
+    if ultimo is not None and ultimo is not tenuto:
+        yield ultimo
+
+
+def iso_utc(t):
+    return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# ----------------- FORMATI -----------------
+def gpx_chunks(sorgente, nome):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           f'<gpx version="1.1" creator="ninux_mobile_anemometer" xmlns="http://www.topografix.com/GPX/1/1" '
+           f'xmlns:vento="{VENTO_NS}">\n'
+           f'<trk><name>{escape(nome)}</name><trkseg>\n')
+    for p in sorgente():
+        ext = "".join(f"<vento:{k}>{p[k]}</vento:{k}>" for k in list(CAMPI_VENTO.values()) + ["twd_deg"] if k in p)
+        yield (f'<trkpt lat="{p["lat"]}" lon="{p["lon"]}"><time>{iso_utc(p["t"])}</time>'
+               + (f"<extensions>{ext}</extensions>" if ext else "") + "</trkpt>\n")
+    yield "</trkseg></trk>\n</gpx>\n"
+
+
+def geojson_chunks(sorgente, nome):
+    """FeatureCollection: la traccia (LineString) seguita da un Point per campione."""
+    yield '{"type": "FeatureCollection", "name": ' + json.dumps(nome) + ', "features": [\n'
+    yield '{"type": "Feature", "properties": {"tipo": "traccia"}, "geometry": {"type": "LineString", "coordinates": ['
+    primo = True
+    for p in sorgente():
+        yield ("" if primo else ",") + f'[{p["lon"]},{p["lat"]}]'
+        primo = False
+    yield "]}}"
+    for p in sorgente():
+        props = {k: v for k, v in p.items() if k not in ("lat", "lon")}
+        props["time"] = iso_utc(p["t"])
+        yield (',\n{"type": "Feature", "properties": ' + json.dumps(props)
+               + f', "geometry": {{"type": "Point", "coordinates": [{p["lon"]},{p["lat"]}]}}}}')
+    yield "\n]}\n"
+
+
+def kml_chunks(sorgente, nome):
+    """Documento KML: traccia come LineString e cartella di punti con icona ruotata sul vento reale."""
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+           f'<name>{escape(nome)}</name>\n'
+           '<Style id="traccia"><LineStyle><color>ff0000ff</color><width>3</width></LineStyle></Style>\n'
+           '<Placemark><name>Traccia</name><styleUrl>#traccia</styleUrl><LineString><tessellate>1</tessellate>'
+           '<coordinates>\n')
+    for p in sorgente():
+        yield f'{p["lon"]},{p["lat"]},0\n'
+    yield "</coordinates></LineString></Placemark>\n<Folder><name>Vento</name>\n"
+    for p in sorgente():
+        dati = "".join(f'<Data name="{k}"><value>{v}</value></Data>'
+                       for k, v in p.items() if k not in ("t", "lat", "lon"))
+        stile = ""
+        if "twd_deg" in p:
+            stile = (f'<Style><IconStyle><heading>{p["twd_deg"]}</heading><Icon><href>'
+                     'http://maps.google.com/mapfiles/kml/shapes/arrow.png</href></Icon></IconStyle></Style>')
+        yield (f'<Placemark><TimeStamp><when>{iso_utc(p["t"])}</when></TimeStamp>{stile}'
+               f'<ExtendedData>{dati}</ExtendedData>'
+               f'<Point><coordinates>{p["lon"]},{p["lat"]},0</coordinates></Point></Placemark>\n')
+    yield "</Folder>\n</Document></kml>\n"
+
+
+SCRITTORI = {
+    "gpx": (".gpx", gpx_chunks),
+    "geojson": (".geojson", geojson_chunks),
+    "kml": (".kml", kml_chunks),
+}
+
+
+# ----------------- ESPORTAZIONE -----------------
+def nome_base(path):
+    """x.csv -> x, x.csv.gz -> x_gz: il CSV originale e la sua copia compressa
+    (lasciati entrambi da log_compresso.py) non devono scrivere lo stesso file."""
+    nome = os.path.basename(path)
+    suffisso = ""
+    for ext in (".zst", ".gz"):
+        if nome.endswith(ext):
+            nome = nome[:-len(ext)]
+            suffisso = "_" + ext[1:]
+    if nome.endswith(".csv"):
+        nome = nome[:-len(".csv")]
+    return nome + suffisso
+
+
+def esporta(path, formato, out_dir=None, semplifica_m=SEMPLIFICA_M, t_start=None, t_end=None):
+    """Esporta una sessione in un formato; restituisce il percorso scritto.
+
+    GeoJSON e KML rileggono la sessione una seconda volta (traccia, poi punti)
+    invece di tenerla in memoria. Se mancano le colonne o i punti validi sono
+    meno di MIN_PUNTI solleva ValueError senza scrivere nulla.
+    """
+    ext, chunks = SCRITTORI[formato]
+    nome = nome_base(path)
+    out = os.path.join(out_dir or os.path.dirname(path), nome + ext)
+
+    def sorgente():
+        return semplifica(punti_sessione(path, t_start, t_end), semplifica_m)
+
+    # controlla intestazione e numero minimo di punti prima di creare il file
+    if len(list(islice(sorgente(), MIN_PUNTI))) < MIN_PUNTI:
+        raise ValueError(f"meno di {MIN_PUNTI} punti GPS validi, niente da esportare")
+
+    tmp = out + ".tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8", buffering=BUFFER_SCRITTURA) as f:
+            for pezzo in chunks(sorgente, nome):
+                f.write(pezzo)
+        os.replace(tmp, out)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Esporta sessioni in GPX/GeoJSON/KML con i dati del vento")
+    ap.add_argument("sessioni", nargs="+", help="vento_compensato*.csv[.gz|.zst]")
+    ap.add_argument("-f", "--formato", action="append", choices=FORMATI, help="ripetibile (default: tutti)")
+    ap.add_argument("-o", "--out-dir", help="cartella di uscita (default: accanto alla sessione)")
+    ap.add_argument("--semplifica-m", type=float, default=SEMPLIFICA_M,
+                    help="distanza minima tra punti esportati (m)")
+    ap.add_argument("--t-start", type=float, help="timestamp unix iniziale")
+    ap.add_argument("--t-end", type=float, help="timestamp unix finale")
+    ap.add_argument("-j", "--workers", type=int, help="processi (default: numero di CPU)")
+    args = ap.parse_args()
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    sessioni = []
+    uscite = {}
+    for s in dict.fromkeys(os.path.abspath(s) for s in args.sessioni):
+        if is_summary_path(s):
+            # i riepiloghi vento_compensato_<N>s.csv di aggregatore.py non sono sessioni
+            print(f"⏭️ {s}: riepilogo di aggregatore.py, saltato")
+            continue
+        out = os.path.join(args.out_dir or os.path.dirname(s), nome_base(s))
+        if out in uscite:
+            ap.error(f"{s} e {uscite[out]} verrebbero esportati negli stessi file")
+        uscite[out] = s
+        sessioni.append(s)
+    lavori = [(s, f) for s in sessioni for f in (args.formato or FORMATI)]
+    errori = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(esporta, s, f, args.out_dir, args.semplifica_m, args.t_start, args.t_end): (s, f)
+                   for s, f in lavori}
+        for fut in as_completed(futures):
+            s, f = futures[fut]
+            try:
+                print(f"✅ {fut.result()}")
+            except Exception as e:
+                errori += 1
+                print(f"❌ {s} ({f}): {e}")
+    print(f"🏁 {len(lavori) - errori} esportazioni, {errori} errori")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Generatore di carico sintetico per stressare la pipeline di completo.py senza dispositivi BLE.
+
+Ogni sensore ha una sorgente sintetica che entra negli stessi punti di ingresso
+dei dispositivi reali:
+- GPS: frasi NMEA RMC scritte su una pty, lette da completo.gps_reader()
+- WT901: pacchetti 0x61/0x71 passati a completo.wt901_handle() come le notifiche BLE
+- Calypso: letture passate a completo.process_reading() come da subscribe_reading()
+
+Frequenza, jitter e perdita di campioni sono configurabili; alla fine viene
+stampato per ogni flusso: campioni inviati/elaborati/persi, latenza end-to-end
+e CPU spesa negli handler.
+"""
+import argparse
+import asyncio
+import contextlib
+import math
+import os
+import random
+import struct
+import threading
+import time
+import tty
+from datetime import datetime
+from types import SimpleNamespace
+
+import completo
+from aggregatore import AggregatoreVento
+
+# ----------------- CONFIG -----------------
+GPS_HZ = 10.0
+WT901_HZ = 100.0
+CALYPSO_HZ = 8.0
+JITTER_MS = 2.0
+DROPOUT = 0.0
+DURATA_S = 30.0
+# fuori dal glob vento_compensato*.csv: non deve finire tra le sessioni vere
+CSV_STRESS = "stress_vento.csv"
+
+# traccia sintetica: cerchio attorno a questo punto, vento costante con rumore
+LAT0, LON0 = 45.4640, 9.1900
+RAGGIO_M = 300.0
+BOAT_KN = 5.0
+TWD_DEG = 200.0
+TWS_KN = 12.0
+
+
+class StatisticheFlusso:
+    def __init__(self, nome, hz):
+        self.nome = nome
+        self.hz = hz
+        self.inviati = 0
+        self.dropout = 0        # campioni non inviati di proposito
+        self.ricevuti = 0
+        self.latenze = []       # s
+        self.cpu_s = 0.0
+
+    def elaborato(self, t_invio, cpu_s):
+        self.ricevuti += 1
+        self.latenze.append(time.perf_counter() - t_invio)
+        self.cpu_s += cpu_s
+
+    def riga(self, durata_s):
+        lat = sorted(self.latenze)
+
+        def pct(p):
+            if not lat:
+                return float("nan")
+            return lat[min(len(lat) - 1, int(p / 100.0 * len(lat)))] * 1000.0
+
+        persi = self.inviati - self.ricevuti
+        return (f"{self.nome:<8} {self.hz:>7.1f} {self.inviati:>8} {self.dropout:>7} {self.ricevuti:>8} "
+                f"{persi:>6} {self.ricevuti / durata_s:>8.1f} {pct(50):>8.2f} {pct(95):>8.2f} "
+                f"{pct(99):>8.2f} {pct(100):>8.2f} {self.cpu_s * 1000.0:>9.1f} "
+                f"{(self.cpu_s / self.ricevuti * 1e6) if self.ricevuti else float('nan'):>9.1f}")
+
+
+INTESTAZIONE = (f"{'flusso':<8} {'Hz':>7} {'inviati':>8} {'dropout':>7} {'elab.':>8} {'persi':>6} "
+                f"{'elab/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+                f"{'CPU ms':>9} {'CPU us/c':>9}")
+
+
+# ----------------- DATI SINTETICI -----------------
+def posizione(t):
+    """Posizione, rotta e velocita' della barca sul cerchio sintetico al tempo t (s)."""
+    omega = BOAT_KN * 0.514444 / RAGGIO_M
+    a = omega * t
+    dn = RAGGIO_M * math.cos(a)
+    de = RAGGIO_M * math.sin(a)
+    lat = LAT0 + math.degrees(dn / 6371000.0)
+    lon = LON0 + math.degrees(de / (6371000.0 * math.cos(math.radians(LAT0))))
+    cog = (math.degrees(a) + 90.0) % 360.0
+    return lat, lon, cog, BOAT_KN
+
+
+def nmea_checksum(body):
+    cs = 0
+    for c in body:
+        cs ^= ord(c)
+    return f"{cs:02X}"
+
+
+def frase_rmc(t, t_wall):
+    lat, lon, cog, spd = posizione(t)
+    now = datetime.utcfromtimestamp(t_wall)
+    lat_d = int(abs(lat))
+    lon_d = int(abs(lon))
+    body = (f"GPRMC,{now:%H%M%S}.{now.microsecond // 10000:02d},A,"
+            f"{lat_d:02d}{(abs(lat) - lat_d) * 60:09.6f},{'N' if lat >= 0 else 'S'},"
+            f"{lon_d:03d}{(abs(lon) - lon_d) * 60:09.6f},{'E' if lon >= 0 else 'W'},"
+            f"{spd:.2f},{cog:.2f},{now:%d%m%y},,,A")
+    return f"${body}*{nmea_checksum(body)}"
+
+
+def _s16(v):
+    return max(-32768, min(32767, int(round(v))))
+
+
+def frame_wt901_acc(ax, ay, az):
+    """Pacchetto 0x61 (acc + gyro + angoli) con la mappatura assi letta da completo.decode_wt901_frame."""
+    raw = [az, ay, -ax]
+    dati = struct.pack("<3h", *[_s16(v / 16.0 * 32768.0) for v in raw]) + bytes(12)
+    return bytes([0x55, 0x61]) + dati
+
+
+def frame_wt901_mag(mx, my, mz):
+    """Pacchetto 0x71 di lettura registri a partire da 0x3A (Hx, Hy, Hz)."""
+    dati = struct.pack("<3h", *[_s16(v * 150.0) for v in (mx, my, mz)]) + bytes(10)
+    return bytes([0x55, 0x71, 0x3A, 0x00]) + dati
+
+
+def campo_magnetico(heading_deg):
+    """Vettore magnetico orizzontale (uT) che con la barca in piano da' l'heading richiesto."""
+    h = math.radians(heading_deg)
+    return 40.0 * math.cos(h), 40.0 * math.sin(h), -30.0
+
+
+def lettura_calypso(t):
+    """Lettura apparente coerente con il vento reale e la rotta sintetici."""
+    _, _, cog, spd = posizione(t)
+    tws = TWS_KN + random.gauss(0.0, 1.0)
+    twa = math.radians((TWD_DEG - cog + random.gauss(0.0, 5.0)) % 360.0)
+    aw_x = tws * math.cos(twa) + spd
+    aw_y = tws * math.sin(twa)
+    aws = math.hypot(aw_x, aw_y)
+    awa = (math.degrees(math.atan2(aw_y, aw_x)) + 360.0) % 360.0
+    return SimpleNamespace(wind_speed=aws / 1.943844, wind_direction=round(awa))
+
+
+# ----------------- SORGENTI -----------------
+def _istante_invio(t0, k, hz, jitter_ms):
+    return t0 + k / hz + max(0.0, random.gauss(0.0, jitter_ms / 1000.0))
+
+
+def _invia(stats, dropout, emetti, k, t_sched):
+    if random.random() < dropout:
+        stats.dropout += 1
+    else:
+        stats.inviati += 1
+        emetti(k, t_sched)
+
+
+async def sorgente(stats, jitter_ms, dropout, durata_s, emetti):
+    """Chiama emetti(k, t_invio) a stats.hz con jitter gaussiano e perdita casuale."""
+    t0 = time.perf_counter()
+    k = 0
+    while True:
+        t_sched = _istante_invio(t0, k, stats.hz, jitter_ms)
+        if t_sched - t0 > durata_s:
+            return
+        ritardo = t_sched - time.perf_counter()
+        if ritardo > 0:
+            await asyncio.sleep(ritardo)
+        _invia(stats, dropout, emetti, k, t_sched)
+        k += 1
+
+
+def sorgente_thread(stats, jitter_ms, dropout, durata_s, emetti, stop):
+    """Come sorgente(), ma in un thread proprio: simula un dispositivo che trasmette
+    indipendentemente dall'event loop (che gps_reader puo' bloccare in readline)."""
+    t0 = time.perf_counter()
+    k = 0
+    while not stop.is_set():
+        t_sched = _istante_invio(t0, k, stats.hz, jitter_ms)
+        if t_sched - t0 > durata_s:
+            return
+        ritardo = t_sched - time.perf_counter()
+        if ritardo > 0:
+            time.sleep(ritardo)
+        _invia(stats, dropout, emetti, k, t_sched)
+        k += 1
+
+
+def misura(stats, t_invio, handler, *args):
+    c0 = time.thread_time()
+    handler(*args)
+    stats.elaborato(t_invio, time.thread_time() - c0)
+
+
+async def esegui(args):
+    flussi = {
+        "gps": StatisticheFlusso("gps", args.gps_hz),
+        "wt901": StatisticheFlusso("wt901", args.wt901_hz),
+        "calypso": StatisticheFlusso("calypso", args.calypso_hz),
+    }
+    t_start = time.perf_counter()
+    tasks = []
+    threads = []
+    stop = threading.Event()
+
+    # GPS: pty al posto di /dev/serial0, letta dal vero gps_reader
+    if args.gps_hz > 0:
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        porta = os.ttyname(slave)
+        inviate = {}    # fix decodificato -> istante di invio
+
+        def on_fix(lat, lon, spd):
+            t_invio = inviate.pop((lat, lon, spd), None)
+            if t_invio is None:
+                completo.apply_gps_fix(lat, lon, spd)
+                return
+            misura(flussi["gps"], t_invio, completo.apply_gps_fix, lat, lon, spd)
+
+        # scritto da un thread separato, come un ricevitore GPS vero
+        def emetti_gps(k, t_invio):
+            riga = frase_rmc(t_invio - t_start, time.time())
+            inviate[completo.decode_nmea_rmc(riga)] = t_invio
+            os.write(master, (riga + "\r\n").encode("ascii"))
+
+        tasks.append(asyncio.create_task(completo.gps_reader(port=porta, on_fix=on_fix)))
+        threads.append(threading.Thread(
+            target=sorgente_thread, name="nmea-sintetico", daemon=True,
+            args=(flussi["gps"], args.jitter_ms, args.dropout, args.durata, emetti_gps, stop)))
+
+    # WT901: alterna pacchetti 0x61 e 0x71, come le notifiche BLE
+    if args.wt901_hz > 0:
+        def emetti_wt901(k, t_invio):
+            _, _, cog, _ = posizione(t_invio - t_start)
+            if k % 2 == 0:
+                frame = frame_wt901_acc(random.gauss(0.0, 0.02), random.gauss(0.0, 0.02), 1.0)
+            else:
+                frame = frame_wt901_mag(*campo_magnetico(cog + random.gauss(0.0, 2.0)))
+            misura(flussi["wt901"], t_invio, completo.wt901_handle, None, frame)
+
+        tasks.append(asyncio.create_task(
+            sorgente(flussi["wt901"], args.jitter_ms, args.dropout, args.durata, emetti_wt901)))
+
+    # Calypso: letture passate al callback di subscribe_reading
+    if args.calypso_hz > 0:
+        def emetti_calypso(k, t_invio):
+            lettura = lettura_calypso(t_invio - t_start)
+            misura(flussi["calypso"], t_invio, completo.process_reading, lettura)
+
+        tasks.append(asyncio.create_task(
+            sorgente(flussi["calypso"], args.jitter_ms, args.dropout, args.durata, emetti_calypso)))
+
+    cpu0 = time.process_time()
+    for th in threads:
+        th.start()
+    await asyncio.sleep(args.durata + 1.0)     # 1 s per smaltire le code
+    cpu_tot = time.process_time() - cpu0
+    stop.set()
+    for th in threads:
+        th.join()
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return flussi, cpu_tot
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Carico sintetico per la pipeline di completo.py")
+    ap.add_argument("--gps-hz", type=float, default=GPS_HZ, help="frequenza RMC (0 = disattivo)")
+    ap.add_argument("--wt901-hz", type=float, default=WT901_HZ, help="pacchetti WT901/s (0 = disattivo)")
+    ap.add_argument("--calypso-hz", type=float, default=CALYPSO_HZ, help="letture Calypso/s (0 = disattivo)")
+    ap.add_argument("--jitter-ms", type=float, default=JITTER_MS, help="jitter gaussiano sugli invii")
+    ap.add_argument("--dropout", type=float, default=DROPOUT, help="probabilita' di saltare un campione")
+    ap.add_argument("--durata", type=float, default=DURATA_S, help="durata del test (s)")
+    ap.add_argument("--csv", default=CSV_STRESS, help="CSV su cui scrive process_reading")
+    ap.add_argument("--quiet", action="store_true", help="scarta l'output di completo.py")
+    args = ap.parse_args()
+
+    # logga su file separati per non sporcare le sessioni reali
+    completo.CSV_FILE = args.csv
+    completo.aggregatore = AggregatoreVento(args.csv, completo.AGG_FINESTRE_S)
+    completo.ensured_log()
+    completo.aggregatore.ensured_headers()
+
+    print(f"🧪 Carico sintetico per {args.durata:.0f}s: GPS {args.gps_hz} Hz, "
+          f"WT901 {args.wt901_hz} Hz, Calypso {args.calypso_hz} Hz")
+    with contextlib.ExitStack() as stack:
+        if args.quiet:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        flussi, cpu_tot = asyncio.run(esegui(args))
+    completo.aggregatore.chiudi()
+    if completo.log_compresso is not None:
+        completo.log_compresso.close()
+
+    print(INTESTAZIONE)
+    for s in flussi.values():
+        if s.hz > 0:
+            print(s.riga(args.durata))
+    print(f"⏱️ CPU processo: {cpu_tot:.2f}s su {args.durata + 1.0:.0f}s ({cpu_tot / (args.durata + 1.0) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    main()
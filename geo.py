@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""Funzioni geografiche senza dipendenze, condivise da completo.py ed esporta.py."""
+import math
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Return distance in meters between two lat/lon points."""
+    R = 6371000.0
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return R * c
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Log CSV compresso a blocchi indipendenti con indice laterale per l'accesso casuale.
+
+Il file dati (es. vento_compensato.csv.gz) e' una sequenza di membri gzip (o
+frame zstd) indipendenti, ognuno con le righe CSV di un intervallo di tempo.
+L'indice (file dati + ".idx", CSV) riporta per ogni blocco t_start, t_end
+(minimo e massimo dei timestamp, non prima e ultima riga: l'orologio puo'
+tornare indietro dopo un aggiustamento NTP), offset e lunghezza in byte,
+cosi' chi legge decomprime solo i blocchi utili.
+"""
+import csv
+import gzip
+import io
+import os
+
+try:
+    import zstandard
+except ImportError:     # zstd opzionale: senza, si usa gzip
+    zstandard = None
+
+# ----------------- CONFIG -----------------
+RIGHE_PER_BLOCCO = 480          # ~1 minuto a 8 Hz
+SECONDI_PER_BLOCCO = 60.0       # chiude comunque il blocco dopo questo intervallo
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 9
+
+INDEX_HEADER = ["chunk", "t_start", "t_end", "offset", "length", "rows"]
+
+# estensioni riconosciute come log compressi
+EXT_COMPRESSE = (".gz", ".zst")
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def is_compresso(path):
+    return path.endswith(EXT_COMPRESSE)
+
+
+def _comprimi(path, dati):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Modulo 'zstandard' non installato: usa un file .gz")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(dati)
+    return gzip.compress(dati, compresslevel=GZIP_LEVEL)
+
+
+def _decomprimi(path, dati):
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Modulo 'zstandard' non installato: impossibile leggere .zst")
+        return zstandard.ZstdDecompressor().decompress(dati)
+    return gzip.decompress(dati)
+
+
+class ChunkedLogWriter:
+    """Scrive righe CSV in blocchi compressi indipendenti e aggiorna l'indice.
+
+    Le righe restano in memoria fino alla chiusura del blocco (RIGHE_PER_BLOCCO
+    righe o SECONDI_PER_BLOCCO secondi); in caso di crash si perde al piu' il
+    blocco corrente. La prima colonna di ogni riga deve essere il timestamp.
+    """
+
+    def __init__(self, path, header, righe_per_blocco=RIGHE_PER_BLOCCO,
+                 secondi_per_blocco=SECONDI_PER_BLOCCO):
+        self.path = path
+        self.header = list(header)
+        self.righe_per_blocco = righe_per_blocco
+        self.secondi_per_blocco = secondi_per_blocco
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.righe = 0
+        self.t_primo = None     # timestamp della prima riga, per la durata del blocco
+        self.t_start = None     # minimo e massimo dei timestamp del blocco
+        self.t_end = None
+        self.n_blocchi = 0
+        self._ensured_files()
+
+    def _ensured_files(self):
+        idx = index_path(self.path)
+        if not os.path.exists(idx) or os.path.getsize(idx) == 0:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                raise RuntimeError(f"File dati {self.path} presente senza indice {idx}")
+            open(self.path, "wb").close()
+            with open(idx, "w", newline="") as f:
+                w = csv.writer(f)
+                # la prima riga porta l'intestazione del CSV originale
+                w.writerow(["#header"] + self.header)
+                w.writerow(INDEX_HEADER)
+        else:
+            ripara_indice(self.path)
+            self.n_blocchi = len(leggi_indice(self.path)[1])
+            if not os.path.exists(self.path):
+                open(self.path, "wb").close()
+
+    def writerow(self, row):
+        t = float(row[0])
+        if self.t_primo is None:
+            self.t_primo = self.t_start = self.t_end = t
+        else:
+            self.t_start = min(self.t_start, t)
+            self.t_end = max(self.t_end, t)
+        self.writer.writerow(row)
+        self.righe += 1
+        if self.righe >= self.righe_per_blocco or abs(t - self.t_primo) >= self.secondi_per_blocco:
+            self.flush()
+
+    def flush(self):
+        """Comprime il blocco corrente, lo accoda al file dati e aggiorna l'indice."""
+        if self.righe == 0:
+            return
+        dati = _comprimi(self.path, self.buffer.getvalue().encode("utf-8"))
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(dati)
+            f.flush()
+            os.fsync(f.fileno())
+        # l'indice si aggiorna solo dopo che il blocco e' su disco
+        with open(index_path(self.path), "a", newline="") as f:
+            csv.writer(f).writerow([self.n_blocchi, self.t_start, self.t_end, offset, len(dati), self.righe])
+            f.flush()
+            os.fsync(f.fileno())
+        self.n_blocchi += 1
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.righe = 0
+        self.t_primo = None
+        self.t_start = None
+        self.t_end = None
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def ripara_indice(path):
+    """Tronca l'indice all'ultima riga completa (riga parziale lasciata da un'interruzione)."""
+    idx = index_path(path)
+    with open(idx, "r+b") as f:
+        dati = f.read()
+        if dati and not dati.endswith(b"\n"):
+            f.truncate(dati.rfind(b"\n") + 1)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def leggi_indice(path):
+    """Restituisce (header_csv, lista di blocchi) dall'indice laterale."""
+    blocchi = []
+    with open(index_path(path), newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader)[1:]
+        next(reader)
+        for r in reader:
+            # righe troncate o fuse da un crash durante la scrittura vengono ignorate
+            if len(r) != len(INDEX_HEADER):
+                continue
+            try:
+                t1, t2 = float(r[1]), float(r[2])
+                blocchi.append({
+                    # gli indici scritti prima del min/max hanno prima e ultima riga
+                    "chunk": int(r[0]), "t_start": min(t1, t2), "t_end": max(t1, t2),
+                    "offset": int(r[3]), "length": int(r[4]), "rows": int(r[5]),
+                })
+            except ValueError:
+                continue
+    return header, blocchi
+
+
+def iter_righe_compresse(path, t_start=None, t_end=None):
+    """Genera le righe (dict) nella finestra [t_start, t_end] decomprimendo solo i blocchi necessari."""
+    header, blocchi = leggi_indice(path)
+    with open(path, "rb") as f:
+        for b in blocchi:
+            if t_start is not None and b["t_end"] < t_start:
+                continue
+            if t_end is not None and b["t_start"] > t_end:
+                continue
+            f.seek(b["offset"])
+            testo = _decomprimi(path, f.read(b["length"])).decode("utf-8")
+            for row in csv.DictReader(io.StringIO(testo, newline=""), fieldnames=header):
+                if t_start is not None or t_end is not None:
+                    t = float(row[header[0]])
+                    if (t_start is not None and t < t_start) or (t_end is not None and t > t_end):
+                        continue
+                yield row
+
+
+def apri_log(path, t_start=None, t_end=None):
+    """Restituisce (fieldnames, iteratore di righe dict) per CSV semplici o compressi.
+
+    Per i CSV non compressi la finestra temporale viene applicata filtrando
+    le righe lette in sequenza.
+    """
+    if is_compresso(path):
+        header, _ = leggi_indice(path)
+        return header, iter_righe_compresse(path, t_start, t_end)
+
+    f = open(path, newline="", encoding="utf-8")
+    reader = csv.DictReader(f)
+    fieldnames = reader.fieldnames or []
+
+    def righe():
+        with f:
+            for row in reader:
+                if t_start is not None or t_end is not None:
+                    try:
+                        t = float(row[fieldnames[0]])
+                    except (TypeError, ValueError):
+                        continue
+                    if (t_start is not None and t < t_start) or (t_end is not None and t > t_end):
+                        continue
+                yield row
+
+    return fieldnames, righe()
+
+
+def comprimi_csv(src, dst, righe_per_blocco=RIGHE_PER_BLOCCO):
+    """Converte un CSV di sessione esistente nel formato compresso a blocchi."""
+    with open(src, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        with ChunkedLogWriter(dst, header, righe_per_blocco=righe_per_blocco,
+                              secondi_per_blocco=float("inf")) as w:
+            for row in reader:
+                if row:
+                    w.writerow(row)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("Uso: log_compresso.py <sessione.csv> <sessione.csv.gz|.zst>")
+        sys.exit(1)
+    comprimi_csv(sys.argv[1], sys.argv[2])
+    print(f"✅ {sys.argv[1]} -> {sys.argv[2]} ({os.path.getsize(sys.argv[2])} byte)")
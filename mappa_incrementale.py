@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Aggiornamento incrementale della mappa di test_mappa6 durante sessioni lunghe.
+
+La pagina HTML viene generata una sola volta e carica i punti da un file dati
+JavaScript a cui si accodano solo le righe nuove del CSV. Lo stato (offset in
+byte, righe lette, dimensione del file dati) e' salvato in un file JSON, cosi'
+ogni esecuzione costa in proporzione ai dati aggiunti e non all'intera sessione.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+
+import folium
+from branca.element import MacroElement, Template
+
+import test_mappa6
+from log_compresso import is_compresso
+
+# ----------------- CONFIG -----------------
+CSV_FILE = test_mappa6.CSV_FILE
+OUT_HTML = test_mappa6.OUT_HTML
+MODE = test_mappa6.MODE
+
+# ricarica automatica della pagina nel browser (s); 0 = disattivata
+AUTO_REFRESH_S = 30
+
+# byte iniziali del CSV usati come impronta della sessione
+IMPRONTA_BYTE = 4096
+
+
+def dati_path(out_html):
+    return os.path.splitext(out_html)[0] + "_dati.js"
+
+
+def stato_path(out_html):
+    return os.path.splitext(out_html)[0] + "_stato.json"
+
+
+class TracciaIncrementale(MacroElement):
+    """Disegna traccia e frecce leggendo DATI_TRACCIA, popolato dal file dati."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var mappa = {{ this._parent.get_name() }};
+            var punti = [];
+            function freccia(deg, color, scale, dx, dy) {
+                return L.divIcon({
+                    iconSize: [20, 20],
+                    iconAnchor: [10, 10],
+                    className: "",
+                    html: '<div style="transform: translate(' + dx + 'px, ' + dy + 'px) rotate(' + deg + 'deg);'
+                        + ' transform-origin: center center; font-size:' + scale + 'px; color:' + color + ';'
+                        + ' line-height: 20px;">▲</div>'
+                });
+            }
+            DATI_TRACCIA.forEach(function(p) {
+                var ll = [p[0], p[1]];
+                punti.push(ll);
+                p[3].forEach(function(f) {
+                    L.marker(ll, {icon: freccia(f[0], f[1], f[2], f[3], f[4])})
+                        .bindPopup(p[2]).addTo(mappa);
+                });
+            });
+            if (punti.length) {
+                var linea = L.polyline(punti, {color: "red", weight: 3, opacity: 0.8}).addTo(mappa);
+                mappa.fitBounds(linea.getBounds());
+            }
+        })();
+        {% endmacro %}
+    """)
+
+
+def frecce(p, mode):
+    """Frecce [deg, colore, scala, dx, dy] come in test_mappa6.genera_mappa."""
+    if mode == "heading":
+        return [[test_mappa6.norm_heading(p["heading_mag"]), "blue", 18, -6, 0],
+                [test_mappa6.norm_heading(p["heading_gps"]), "green", 16, 6, 0]]
+    if mode == "wind":
+        return [[test_mappa6.norm_heading(p["tws_nord"]), "red", 20, 0, 0]]
+    return []
+
+
+def scrivi_pagina(out_html):
+    """Pagina HTML statica che carica il file dati a ogni apertura/ricarica."""
+    m = folium.Map(location=[45.4640, 9.1900], zoom_start=14)
+    header = m.get_root().header
+    if AUTO_REFRESH_S:
+        header.add_child(folium.Element(f'<meta http-equiv="refresh" content="{AUTO_REFRESH_S}">'))
+    header.add_child(folium.Element(
+        "<script>var DATI_TRACCIA = []; function P(lat, lon, popup, frecce) "
+        "{ DATI_TRACCIA.push([lat, lon, popup, frecce]); }</script>"))
+    header.add_child(folium.Element(f'<script src="{os.path.basename(dati_path(out_html))}"></script>'))
+    m.add_child(TracciaIncrementale())
+    m.save(out_html)
+
+
+def impronta(csv_file, lunghezza):
+    """Impronta della sessione: inode e hash dei primi `lunghezza` byte."""
+    with open(csv_file, "rb") as f:
+        testa = f.read(lunghezza)
+        ino = os.fstat(f.fileno()).st_ino
+    return {"ino": ino, "len": len(testa), "sha256": hashlib.sha256(testa).hexdigest()}
+
+
+def stessa_sessione(csv_file, stato):
+    """True se il CSV e' ancora quello (cresciuto) gia' elaborato e non un file sostituito."""
+    prec = stato.get("impronta")
+    if prec is None:
+        return False
+    return impronta(csv_file, prec["len"]) == prec
+
+
+def impronta_pagina(out_html):
+    """Hash della pagina generata; None se manca (la pagina e' piccola, i punti stanno nel file dati)."""
+    try:
+        with open(out_html, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def carica_stato(out_html):
+    try:
+        with open(stato_path(out_html), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def salva_stato(out_html, stato):
+    tmp = stato_path(out_html) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(stato, f, indent=1)
+    os.replace(tmp, stato_path(out_html))
+
+
+def aggiorna_mappa(csv_file=CSV_FILE, out_html=OUT_HTML, mode=MODE):
+    """Accoda alla mappa solo le righe aggiunte al CSV dall'ultima esecuzione."""
+    if is_compresso(csv_file):
+        raise ValueError("La modalita' incrementale richiede il CSV in chiaro")
+
+    dati = dati_path(out_html)
+    size = os.path.getsize(csv_file)
+    stato = carica_stato(out_html)
+    if (stato is None or stato["csv_file"] != os.path.abspath(csv_file) or stato["mode"] != mode
+            or size < stato["offset"] or not stessa_sessione(csv_file, stato)
+            or not os.path.exists(dati) or impronta_pagina(out_html) != stato.get("pagina")):
+        # primo avvio, sessione diversa (file sostituito), CSV troncato o pagina
+        # sovrascritta (es. da test_mappa6.genera_mappa sullo stesso OUT_HTML): si riparte da zero
+        stato = {"csv_file": os.path.abspath(csv_file), "mode": mode, "fieldnames": None,
+                 "offset": 0, "rows": 0, "points": 0, "dati_size": 0}
+        with open(dati, "w", encoding="utf-8"):
+            pass
+        scrivi_pagina(out_html)
+        stato["pagina"] = impronta_pagina(out_html)
+        print(f"🆕 Pagina creata: '{out_html}' (dati in '{dati}')")
+    elif os.path.getsize(dati) != stato["dati_size"]:
+        # scrittura interrotta dopo l'ultimo salvataggio dello stato
+        with open(dati, "r+b") as f:
+            f.truncate(stato["dati_size"])
+
+    with open(csv_file, "rb") as f:
+        f.seek(stato["offset"])
+        nuovo = f.read()
+    # considera solo righe complete: l'ultima potrebbe essere ancora in scrittura
+    fine = nuovo.rfind(b"\n") + 1
+    if fine == 0:
+        print("⏸️ Nessuna riga nuova")
+        return 0
+    testo = nuovo[:fine].decode("utf-8")
+
+    reader = csv.reader(io.StringIO(testo, newline=""))
+    if stato["fieldnames"] is None:
+        fieldnames = next(reader)
+        missing = [c for c in test_mappa6.REQUIRED_FIELDS if c not in fieldnames]
+        if missing:
+            raise ValueError(f"Colonne mancanti nel CSV: {missing}")
+        stato["fieldnames"] = fieldnames
+
+    righe = 0
+    out = []
+    for r in reader:
+        if not r:
+            continue
+        row = dict(zip(stato["fieldnames"], r))
+        righe += 1
+        p = test_mappa6.leggi_punto(row)
+        if p is None:
+            continue
+        out.append(f"P({p['lat']},{p['lon']},{json.dumps(p['popup'])},{json.dumps(frecce(p, mode))});\n")
+
+    with open(dati, "a", encoding="utf-8") as f:
+        f.write("".join(out))
+
+    stato["offset"] += fine
+    stato["rows"] += righe
+    stato["points"] += len(out)
+    stato["dati_size"] = os.path.getsize(dati)
+    stato["impronta"] = impronta(csv_file, min(stato["offset"], IMPRONTA_BYTE))
+    salva_stato(out_html, stato)
+    print(f"✅ +{len(out)} punti ({righe} righe nuove), totale {stato['points']} punti / {stato['rows']} righe")
+    return len(out)
+
+
+def main():
+    aggiorna_mappa()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Genera in parallelo le mappe di tutte le sessioni di una cartella, con cache su hash.
+
+Ogni mappa e' identificata dall'hash del contenuto della sessione, delle opzioni
+di rendering (MODE, finestra temporale) e del codice di rendering: se nulla e'
+cambiato e l'HTML esiste gia', la sessione viene saltata.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import test_mappa6
+from aggregatore import is_summary_path
+from log_compresso import index_path, is_compresso
+
+# ----------------- CONFIG -----------------
+PATTERNS = ("vento_compensato*.csv", "vento_compensato*.csv.gz", "vento_compensato*.csv.zst")
+CACHE_FILE = ".cache_mappe.json"
+HASH_BLOCK = 1 << 20
+
+# sorgenti che influenzano l'HTML prodotto: se cambiano, la cache si invalida
+RENDER_SOURCES = ("test_mappa6.py", "log_compresso.py")
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for blocco in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(blocco)
+    return h.hexdigest()
+
+
+def stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def session_files(path):
+    """File che compongono una sessione (dati + indice per i log compressi)."""
+    return [path, index_path(path)] if is_compresso(path) else [path]
+
+
+def content_hash(path, cache_stat):
+    """Hash del contenuto della sessione; riusa quello in cache se size/mtime non sono cambiati."""
+    parti = []
+    for p in session_files(path):
+        st = stat_key(p)
+        prec = cache_stat.get(p)
+        if prec and prec["stat"] == st:
+            digest = prec["sha256"]
+        else:
+            digest = file_sha256(p)
+            cache_stat[p] = {"stat": st, "sha256": digest}
+        parti.append(digest)
+    return hashlib.sha256("".join(parti).encode()).hexdigest()
+
+
+def render_hash():
+    base = os.path.dirname(os.path.abspath(__file__))
+    h = hashlib.sha256()
+    for name in RENDER_SOURCES:
+        h.update(file_sha256(os.path.join(base, name)).encode())
+    return h.hexdigest()
+
+
+def cache_key(session_hash, options, code_hash):
+    payload = json.dumps({"session": session_hash, "options": options, "code": code_hash}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def out_name(path, mode):
+    """x.csv -> x_wind.html, x.csv.gz -> x_gz_wind.html: la coppia lasciata da
+    log_compresso.py (CSV originale + compresso) non deve finire nello stesso HTML."""
+    nome = os.path.basename(path)
+    suffisso = ""
+    for ext in (".zst", ".gz"):
+        if nome.endswith(ext):
+            nome = nome[:-len(ext)]
+            suffisso = "_" + ext[1:]
+    if nome.endswith(".csv"):
+        nome = nome[:-len(".csv")]
+    return f"{nome}{suffisso}_{mode}.html"
+
+
+def load_cache(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"maps": {}, "stat": {}}
+
+
+def save_cache(path, cache):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _render(csv_file, out_html, options):
+    t0 = time.perf_counter()
+    n = test_mappa6.genera_mappa(csv_file, out_html, mode=options["mode"],
+                                 t_start=options["t_start"], t_end=options["t_end"])
+    return n, time.perf_counter() - t0
+
+
+def batch(sessions_dir, out_dir=None, mode=test_mappa6.MODE, t_start=None, t_end=None,
+          workers=None, force=False):
+    out_dir = out_dir or sessions_dir
+    os.makedirs(out_dir, exist_ok=True)
+    cache_path = os.path.join(out_dir, CACHE_FILE)
+    cache = load_cache(cache_path)
+
+    # i riepiloghi vento_compensato_<N>s.csv di aggregatore.py non sono sessioni
+    sessioni = sorted({p for pat in PATTERNS for p in glob.glob(os.path.join(sessions_dir, pat))
+                       if not is_summary_path(p)})
+    options = {"mode": mode, "t_start": t_start, "t_end": t_end}
+    code_hash = render_hash()
+
+    da_fare = []
+    saltate = 0
+    for path in sessioni:
+        out_html = os.path.join(out_dir, out_name(path, mode))
+        key = cache_key(content_hash(path, cache["stat"]), options, code_hash)
+        if not force and cache["maps"].get(out_html) == key and os.path.exists(out_html):
+            saltate += 1
+            continue
+        da_fare.append((path, out_html, key))
+
+    print(f"🗺️ {len(sessioni)} sessioni: {len(da_fare)} da generare, {saltate} invariate")
+    errori = 0
+    if da_fare:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_render, path, out_html, options): (path, out_html, key)
+                       for path, out_html, key in da_fare}
+            for fut in as_completed(futures):
+                path, out_html, key = futures[fut]
+                try:
+                    n, dt = fut.result()
+                except Exception as e:
+                    errori += 1
+                    print(f"❌ {path}: {e}")
+                    continue
+                cache["maps"][out_html] = key
+                print(f"✅ {out_html} ({n} punti, {dt:.1f}s)")
+    # dimentica gli stat dei file non piu' presenti
+    cache["stat"] = {p: v for p, v in cache["stat"].items() if os.path.exists(p)}
+    save_cache(cache_path, cache)
+    return len(da_fare) - errori, saltate, errori
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Genera le mappe di tutte le sessioni di una cartella")
+    ap.add_argument("sessions_dir", help="cartella con i vento_compensato*.csv[.gz|.zst]")
+    ap.add_argument("-o", "--out-dir", help="cartella di uscita (default: sessions_dir)")
+    ap.add_argument("-m", "--mode", default=test_mappa6.MODE, choices=("wind", "heading"))
+    ap.add_argument("--t-start", type=float, help="timestamp unix iniziale")
+    ap.add_argument("--t-end", type=float, help="timestamp unix finale")
+    ap.add_argument("-j", "--workers", type=int, help="processi (default: numero di CPU)")
+    ap.add_argument("-f", "--force", action="store_true", help="ignora la cache e rigenera tutto")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    fatte, saltate, errori = batch(args.sessions_dir, args.out_dir, args.mode, args.t_start,
+                                   args.t_end, args.workers, args.force)
+    print(f"🏁 {fatte} generate, {saltate} dalla cache, {errori} errori in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 import folium
-import csv
 import math
 from folium.features import DivIcon
 
+from log_compresso import apri_log
+
 CSV_FILE = "vento_compensato_last.csv"
 OUT_HTML = "mappa_traccia.html"
 
+# Finestra temporale opzionale (timestamp unix); con log compressi (.gz/.zst)
+# vengono decompressi solo i blocchi che la intersecano
+T_START = None
+T_END = None
+
 # Colonne attese nel CSV
 REQUIRED_FIELDS = [
     "timestamp","lat","lon","gps_speed_kn","heading_gps","heading_mag","shift_deg",
@@ -54,72 +60,71 @@ def main():
     punti = []
     first_point_set = False
 
-    with open(CSV_FILE, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-
-        missing = [c for c in REQUIRED_FIELDS if c not in (reader.fieldnames or [])]
-        if missing:
-            raise ValueError(f"Colonne mancanti nel CSV: {missing}")
+    fieldnames, reader = apri_log(CSV_FILE, T_START, T_END)
 
-        for row in reader:
-            try:
-                lat = parse_required_float(row, "lat")
-                lon = parse_required_float(row, "lon")
+    missing = [c for c in REQUIRED_FIELDS if c not in fieldnames]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {missing}")
 
-                # Salta righe con coordinate nulle
-                if lat == 0 or lon == 0:
-                    continue
+    for row in reader:
+        try:
+            lat = parse_required_float(row, "lat")
+            lon = parse_required_float(row, "lon")
 
-                heading_mag = parse_required_float(row, "heading_mag")
-                heading_gps = parse_required_float(row, "heading_gps")
-
-            except ValueError as e:
-                print(f"⚠️ Riga saltata: {e}")
+            # Salta righe con coordinate nulle
+            if lat == 0 or lon == 0:
                 continue
 
-            ts = row.get("timestamp", "")
-            gps_speed_kn = row.get("gps_speed_kn", "")
-            shift_deg = row.get("shift_deg", "")
-            AWS_kn = row.get("AWS_kn", "")
-            AWA_deg = row.get("AWA_deg", "")
-            AWA_corr_deg = row.get("AWA_corr_deg", "")
-            TWS_kn = row.get("TWS_kn", "")
-            TWA_deg = row.get("TWA_deg", "")
-            tws_nord = (float(TWA_deg) + float(heading_gps)) % 360
-
-            if not first_point_set:
-                m.location = [lat, lon]
-                first_point_set = True
-
-            punti.append([lat, lon])
-
-            popup_html = f"""
-            <b>Timestamp:</b> {ts}<br>
-            <b>GPS speed:</b> {gps_speed_kn} kn<br>
-            <b>Heading GPS:</b> {heading_gps}°<br>
-            <b>Heading Mag:</b> {heading_mag}°<br>
-            <b>Shift:</b> {shift_deg}°<br>
-            <b>AWS:</b> {AWS_kn} kn<br>
-            <b>AWA:</b> {AWA_deg}°<br>
-            <b>AWA Corr:</b> {AWA_corr_deg}°<br>
-            <b>TWS:</b> {TWS_kn} kn<br>
-            <b>TWA:</b> {TWA_deg}°
-            <b>TWS_nord:</b> {tws_nord}°
-            """
-
-            # Marker heading MAG (blu)
-            folium.Marker(
-                location=[lat, lon],
-                popup=popup_html,
-                icon=make_arrow_icon(heading_mag, color="blue",  scale=18, dx=-6, dy=0)
-            ).add_to(m)
-
-            # Marker heading GPS (verde)
-            folium.Marker(
-                location=[lat, lon],
-                popup=popup_html,
-                icon=make_arrow_icon(heading_gps, color="green", scale=16, dx=6, dy=0)
-            ).add_to(m)
+            heading_mag = parse_required_float(row, "heading_mag")
+            heading_gps = parse_required_float(row, "heading_gps")
+
+        except ValueError as e:
+            print(f"⚠️ Riga saltata: {e}")
+            continue
+
+        ts = row.get("timestamp", "")
+        gps_speed_kn = row.get("gps_speed_kn", "")
+        shift_deg = row.get("shift_deg", "")
+        AWS_kn = row.get("AWS_kn", "")
+        AWA_deg = row.get("AWA_deg", "")
+        AWA_corr_deg = row.get("AWA_corr_deg", "")
+        TWS_kn = row.get("TWS_kn", "")
+        TWA_deg = row.get("TWA_deg", "")
+        tws_nord = (float(TWA_deg) + float(heading_gps)) % 360
+
+        if not first_point_set:
+            m.location = [lat, lon]
+            first_point_set = True
+
+        punti.append([lat, lon])
+
+        popup_html = f"""
+        <b>Timestamp:</b> {ts}<br>
+        <b>GPS speed:</b> {gps_speed_kn} kn<br>
+        <b>Heading GPS:</b> {heading_gps}°<br>
+        <b>Heading Mag:</b> {heading_mag}°<br>
+        <b>Shift:</b> {shift_deg}°<br>
+        <b>AWS:</b> {AWS_kn} kn<br>
+        <b>AWA:</b> {AWA_deg}°<br>
+        <b>AWA Corr:</b> {AWA_corr_deg}°<br>
+        <b>TWS:</b> {TWS_kn} kn<br>
+        <b>TWA:</b> {TWA_deg}°
+        <b>TWS_nord:</b> {tws_nord}°
+        """
+
+        # Marker heading MAG (blu)
+        folium.Marker(
+            location=[lat, lon],
+            popup=popup_html,
+            icon=make_arrow_icon(heading_mag, color="blue",  scale=18, dx=-6, dy=0)
+        ).add_to(m)
+
+        # Marker heading GPS (verde)
+        folium.Marker(
+            location=[lat, lon],
+            popup=popup_html,
+            icon=make_arrow_icon(heading_gps, color="green", scale=16, dx=6, dy=0)
+        ).add_to(m)
 
     if punti:
         folium.PolyLine(punti, color="red", weight=3, opacity=0.8).add_to(m)
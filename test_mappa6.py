@@ -1,14 +1,24 @@
 import folium
-import csv
 import math
 from folium.features import DivIcon
 
+from log_compresso import apri_log
+
 CSV_FILE = "vento_compensato_last.csv"
 OUT_HTML = "mappa_traccia.html"
 
+# Finestra temporale opzionale (timestamp unix); con log compressi (.gz/.zst)
+# vengono decompressi solo i blocchi che la intersecano
+T_START = None
+T_END = None
+
 # Modalità di visualizzazione: "heading" oppure "wind"
 MODE = "wind"   # oppure "wind"
 
+# Aggiornamento incrementale (vedi mappa_incrementale.py): accoda solo le righe
+# nuove del CSV invece di rigenerare tutta la mappa
+INCREMENTALE = False
+
 # Colonne attese nel CSV
 REQUIRED_FIELDS = [
     "timestamp","lat","lon","gps_speed_kn","heading_gps","heading_mag","shift_deg",
@@ -52,95 +62,117 @@ def make_arrow_icon(deg, color, scale=18, dx=0, dy=0):
         """
     )
 
-def main():
+def leggi_punto(row):
+    """Valida una riga del CSV e restituisce il punto da disegnare; None se da saltare."""
+    try:
+        lat = parse_required_float(row, "lat")
+        lon = parse_required_float(row, "lon")
+
+        # Salta righe con coordinate nulle
+        if lat == 0 or lon == 0:
+            return None
+
+        heading_mag = parse_required_float(row, "heading_mag")
+        heading_gps = parse_required_float(row, "heading_gps")
+        TWA_deg = parse_required_float(row, "TWA_deg")
+
+    except ValueError as e:
+        print(f"⚠️ Riga saltata: {e}")
+        return None
+
+    ts = row.get("timestamp", "")
+    gps_speed_kn = row.get("gps_speed_kn", "")
+    shift_deg = row.get("shift_deg", "")
+    AWS_kn = row.get("AWS_kn", "")
+    AWA_deg = row.get("AWA_deg", "")
+    AWA_corr_deg = row.get("AWA_corr_deg", "")
+    TWS_kn = row.get("TWS_kn", "")
+
+    # Calcolo vento reale rispetto al Nord
+    tws_nord = (float(TWA_deg) + float(heading_gps)) % 360
+
+    popup_html = f"""
+    <b>Timestamp:</b> {ts}<br>
+    <b>GPS speed:</b> {gps_speed_kn} kn<br>
+    <b>Heading GPS:</b> {heading_gps}°<br>
+    <b>Heading Mag:</b> {heading_mag}°<br>
+    <b>Shift:</b> {shift_deg}°<br>
+    <b>AWS:</b> {AWS_kn} kn<br>
+    <b>AWA:</b> {AWA_deg}°<br>
+    <b>AWA Corr:</b> {AWA_corr_deg}°<br>
+    <b>TWS:</b> {TWS_kn} kn<br>
+    <b>TWA:</b> {TWA_deg}°<br>
+    <b>TWS_nord:</b> {tws_nord}°
+    """
+
+    return {
+        "lat": lat,
+        "lon": lon,
+        "heading_mag": heading_mag,
+        "heading_gps": heading_gps,
+        "tws_nord": tws_nord,
+        "popup": popup_html,
+    }
+
+def genera_mappa(csv_file=CSV_FILE, out_html=OUT_HTML, mode=MODE, t_start=T_START, t_end=T_END):
     m = folium.Map(location=[45.4640, 9.1900], zoom_start=14)
     punti = []
     first_point_set = False
 
-    with open(CSV_FILE, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-
-        missing = [c for c in REQUIRED_FIELDS if c not in (reader.fieldnames or [])]
-        if missing:
-            raise ValueError(f"Colonne mancanti nel CSV: {missing}")
-
-        for row in reader:
-            try:
-                lat = parse_required_float(row, "lat")
-                lon = parse_required_float(row, "lon")
-
-                # Salta righe con coordinate nulle
-                if lat == 0 or lon == 0:
-                    continue
-
-                heading_mag = parse_required_float(row, "heading_mag")
-                heading_gps = parse_required_float(row, "heading_gps")
-                TWA_deg = parse_required_float(row, "TWA_deg")
-
-            except ValueError as e:
-                print(f"⚠️ Riga saltata: {e}")
-                continue
-
-            ts = row.get("timestamp", "")
-            gps_speed_kn = row.get("gps_speed_kn", "")
-            shift_deg = row.get("shift_deg", "")
-            AWS_kn = row.get("AWS_kn", "")
-            AWA_deg = row.get("AWA_deg", "")
-            AWA_corr_deg = row.get("AWA_corr_deg", "")
-            TWS_kn = row.get("TWS_kn", "")
-
-            # Calcolo vento reale rispetto al Nord
-            tws_nord = (float(TWA_deg) + float(heading_gps)) % 360
-
-            if not first_point_set:
-                m.location = [lat, lon]
-                first_point_set = True
-
-            punti.append([lat, lon])
-
-            popup_html = f"""
-            <b>Timestamp:</b> {ts}<br>
-            <b>GPS speed:</b> {gps_speed_kn} kn<br>
-            <b>Heading GPS:</b> {heading_gps}°<br>
-            <b>Heading Mag:</b> {heading_mag}°<br>
-            <b>Shift:</b> {shift_deg}°<br>
-            <b>AWS:</b> {AWS_kn} kn<br>
-            <b>AWA:</b> {AWA_deg}°<br>
-            <b>AWA Corr:</b> {AWA_corr_deg}°<br>
-            <b>TWS:</b> {TWS_kn} kn<br>
-            <b>TWA:</b> {TWA_deg}°<br>
-            <b>TWS_nord:</b> {tws_nord}°
-            """
-
-            if MODE == "heading":
-                # Marker heading MAG (blu)
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=popup_html,
-                    icon=make_arrow_icon(heading_mag, color="blue",  scale=18, dx=-6, dy=0)
-                ).add_to(m)
-
-                # Marker heading GPS (verde)
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=popup_html,
-                    icon=make_arrow_icon(heading_gps, color="green", scale=16, dx=6, dy=0)
-                ).add_to(m)
-
-            elif MODE == "wind":
-                # Marker TWS_nord (rosso)
-                folium.Marker(
-                    location=[lat, lon],
-                    popup=popup_html,
-                    icon=make_arrow_icon(tws_nord, color="red", scale=20)
-                ).add_to(m)
+    fieldnames, reader = apri_log(csv_file, t_start, t_end)
+
+    missing = [c for c in REQUIRED_FIELDS if c not in fieldnames]
+    if missing:
+        raise ValueError(f"Colonne mancanti nel CSV: {missing}")
+
+    for row in reader:
+        p = leggi_punto(row)
+        if p is None:
+            continue
+        lat, lon = p["lat"], p["lon"]
+
+        if not first_point_set:
+            m.location = [lat, lon]
+            first_point_set = True
+
+        punti.append([lat, lon])
+
+        if mode == "heading":
+            # Marker heading MAG (blu)
+            folium.Marker(
+                location=[lat, lon],
+                popup=p["popup"],
+                icon=make_arrow_icon(p["heading_mag"], color="blue",  scale=18, dx=-6, dy=0)
+            ).add_to(m)
+
+            # Marker heading GPS (verde)
+            folium.Marker(
+                location=[lat, lon],
+                popup=p["popup"],
+                icon=make_arrow_icon(p["heading_gps"], color="green", scale=16, dx=6, dy=0)
+            ).add_to(m)
+
+        elif mode == "wind":
+            # Marker TWS_nord (rosso)
+            folium.Marker(
+                location=[lat, lon],
+                popup=p["popup"],
+                icon=make_arrow_icon(p["tws_nord"], color="red", scale=20)
+            ).add_to(m)
 
     if punti:
         folium.PolyLine(punti, color="red", weight=3, opacity=0.8).add_to(m)
 
-    m.save(OUT_HTML)
-    print(f"✅ Mappa salvata come '{OUT_HTML}' in modalità {MODE}")
+    m.save(out_html)
+    print(f"✅ Mappa salvata come '{out_html}' in modalità {mode}")
+    return len(punti)
+
+def main():
+    if INCREMENTALE:
+        from mappa_incrementale import aggiorna_mappa
+        aggiorna_mappa(CSV_FILE, OUT_HTML, MODE)
+    else:
+        genera_mappa()
 
 if __name__ == "__main__":
     main()
-